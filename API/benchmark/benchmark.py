@@ -0,0 +1,210 @@
+# Offline benchmark of the report API. Swaps the Hive-backed Database for one on the
+# embedded DuckDB backend, loaded with synthetic visits, then replays every report route under
+# concurrent load and reports latency percentiles, throughput and peak RSS.
+#
+#   cd API && python -m benchmark.benchmark --rows 1000000 --concurrency 8
+import argparse
+import json
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+import config
+from config.database import Database, DuckDBBackend
+
+BLUEPRINTS = ('sum', 'faculty', 'diagnose', 'gender', 'service', 'room', 'dashboard')
+RANGE_DAYS = (1, 7, 30, 90, 365)
+
+FACULTIES = ['Noi', 'Ngoai', 'San', 'Nhi', 'Mat', 'Tai Mui Hong', 'Rang Ham Mat', 'Da Lieu']
+ROOMS = ['P%03d' % number for number in range(1, 21)]
+DOCTORS = ['Doctor %02d' % number for number in range(1, 51)]
+DIAGNOSES = ['Diagnose %02d' % number for number in range(1, 41)]
+SERVICES = ['Service %02d' % number for number in range(1, 26)]
+
+
+def _pick(values, *salt):
+    # SQL choosing one of values from a hash of the row number
+    choices = '[' + ', '.join("'%s'" % value for value in values) + ']'
+    return "%s[1 + CAST(hash(%s) %% %d AS BIGINT)]" % (choices, ', '.join(salt), len(values))
+
+
+def load_synthetic(db, rows, days, end):
+    # Raw visits shaped like report.report5, with the three BirthDate spellings the ETL
+    # normalizes and one to four services per visit, then the daily rollups the ETL
+    # would have written. Values come from hashes of the row number, so every run
+    # with the same arguments loads the same data.
+    start = end - timedelta(days=days - 1)
+    con = db.backend.database
+    con.execute("CREATE SCHEMA IF NOT EXISTS report")
+    con.execute(f"""
+        CREATE OR REPLACE TABLE report.report5 AS
+        WITH visits AS (
+            SELECT
+                i,
+                DATE '{start.isoformat()}' + CAST(hash(i, 'day') % {days} AS INTEGER) AS visit_date,
+                DATE '1930-01-01' + CAST(hash(i, 'birth') % 33000 AS INTEGER) AS birth
+            FROM range({rows}) t(i)
+        )
+        SELECT
+            'bundle-' || (i // 3) AS id,
+            'P' || (hash(i, 'patient') % {max(rows // 4, 1)}) AS IDPatient,
+            'MR' || i AS "Medical Records",
+            {_pick(['male', 'female'], 'i', "'gender'")} AS Gender,
+            CASE i % 3
+                WHEN 0 THEN CAST(datesub('year', birth, visit_date) AS VARCHAR)
+                WHEN 1 THEN CAST(year(birth) AS VARCHAR)
+                ELSE strftime(birth, '%-d-%-m-%Y')
+            END AS BirthDate,
+            {_pick(DOCTORS, 'i', "'doctor'")} AS DoctorName,
+            {_pick(FACULTIES, 'i', "'faculty'")} AS Faculty,
+            {_pick(ROOMS, 'i', "'room'")} AS Room,
+            {_pick(DIAGNOSES, 'i', "'diagnose'")} AS Diagnose,
+            list_transform(range(CAST(1 + hash(i, 'services') % 4 AS BIGINT)),
+                           lambda j: {_pick(SERVICES, 'i', 'j')}) AS Service,
+            datesub('year', birth, visit_date) AS age_at_visit,
+            CASE
+                WHEN datesub('year', birth, visit_date) < 18 THEN 'children'
+                WHEN datesub('year', birth, visit_date) < 60 THEN 'adults'
+                ELSE 'elders'
+            END AS age_bucket,
+            strftime(visit_date, '%Y') AS year,
+            strftime(visit_date, '%m') AS month,
+            strftime(visit_date, '%d') AS day
+        FROM visits
+    """)
+
+    rollups = {
+        'report.rollup_patients': "SELECT year, month, day, count(*) AS patient_count "
+                                  "FROM report.report5 GROUP BY ALL",
+        'report.rollup_doctor': "SELECT year, month, day, DoctorName, count(*) AS patient_count "
+                                "FROM report.report5 GROUP BY ALL",
+        'report.rollup_faculty_diagnose': "SELECT year, month, day, Faculty, Diagnose, count(*) AS patient_count "
+                                          "FROM report.report5 GROUP BY ALL",
+        'report.rollup_service': "SELECT year, month, day, Room, Service, Gender, count(*) AS service_count "
+                                 "FROM (SELECT year, month, day, Room, unnest(Service) AS Service, Gender "
+                                 "FROM report.report5) GROUP BY ALL",
+        'report.rollup_age': "SELECT year, month, day, Diagnose, age_bucket, count(*) AS patient_count, "
+                             "count(age_at_visit) AS age_count, sum(age_at_visit) AS age_sum "
+                             "FROM report.report5 GROUP BY ALL",
+    }
+    for table, query in rollups.items():
+        con.execute(f"CREATE OR REPLACE TABLE {table} AS {query}")
+    return start
+
+
+def plan_requests(app, requests_per_route, start, end, seed):
+    # Every GET route of the report blueprints, each with date ranges of mixed length
+    from dashboard.dashboard import METRICS
+
+    rng = random.Random(seed)
+    span = (end - start).days
+    plan = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint.split('.')[0] not in BLUEPRINTS or 'GET' not in rule.methods:
+            continue
+        for _ in range(requests_per_route):
+            length = min(rng.choice(RANGE_DAYS), span + 1)
+            first = start + timedelta(days=rng.randint(0, span + 1 - length))
+            headers = {'startdate': first.isoformat(),
+                       'enddate': (first + timedelta(days=length - 1)).isoformat()}
+            if rule.endpoint.startswith('dashboard.'):
+                headers['metrics'] = ','.join(METRICS)
+            plan.append((rule.rule, headers))
+    rng.shuffle(plan)
+    return plan
+
+
+def run(app, plan, concurrency):
+    local = threading.local()
+    results = []
+    lock = threading.Lock()
+
+    def send(item):
+        route, headers = item
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        response = client.get(route, headers=headers)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        with lock:
+            results.append((route, response.status_code, elapsed))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, plan))
+    return results, time.perf_counter() - started
+
+
+def summarize(results, wall_seconds):
+    routes = {}
+    for route, status, elapsed in results:
+        routes.setdefault(route, []).append((status, elapsed))
+
+    summary = {'routes': {}}
+    for route, samples in sorted(routes.items()):
+        latencies = np.array([elapsed for _, elapsed in samples]) * 1000
+        summary['routes'][route] = {
+            'requests': len(samples),
+            'errors': sum(1 for status, _ in samples if status >= 500),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        }
+    summary['requests'] = len(results)
+    summary['seconds'] = round(wall_seconds, 3)
+    summary['throughput_rps'] = round(len(results) / wall_seconds, 2) if wall_seconds else 0.0
+    # ru_maxrss is in KiB on Linux
+    summary['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return summary
+
+
+def print_summary(summary):
+    print('%-45s %8s %7s %10s %10s' % ('route', 'requests', 'errors', 'p50 ms', 'p99 ms'))
+    for route, stats in summary['routes'].items():
+        print('%-45s %8d %7d %10.2f %10.2f' % (route, stats['requests'], stats['errors'],
+                                               stats['p50_ms'], stats['p99_ms']))
+    print('%d requests in %.2fs, %.1f req/s, peak RSS %.1f MB' % (
+        summary['requests'], summary['seconds'], summary['throughput_rps'], summary['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the report API against a local DuckDB stand-in")
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help="synthetic visits to load, e.g. 10000, 1000000 or 10000000")
+    parser.add_argument('--days', type=int, default=365, help="days the visits are spread over")
+    parser.add_argument('--requests', type=int, default=50, help="requests per route")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', default=':memory:', help="DuckDB file to load into (default in memory)")
+    parser.add_argument('--with-cache', action='store_true',
+                        help="keep the result cache enabled; by default every request reaches the database")
+    parser.add_argument('--output', default=None, help="also write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    # Configured as config ships REPORT_BACKEND=duckdb, without the day partials
+    config.db = Database(host=None, port=None, backend=DuckDBBackend(args.database), metrics=config.metrics,
+                         partials_max_bytes=0, live_days=config.LIVE_DAYS)
+    if not args.with_cache:
+        config.cache.max_bytes = 0
+
+    loading = time.perf_counter()
+    end = date.today()
+    start = load_synthetic(config.db, args.rows, args.days, end)
+    print('Loaded %d visits in %.2fs' % (args.rows, time.perf_counter() - loading))
+
+    app = config.create_app()
+    results, wall_seconds = run(app, plan_requests(app, args.requests, start, end, args.seed), args.concurrency)
+    summary = summarize(results, wall_seconds)
+    summary.update(rows=args.rows, days=args.days, concurrency=args.concurrency)
+    print_summary(summary)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    config.db.close()
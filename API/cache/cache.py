@@ -0,0 +1,34 @@
+import hmac
+import os
+
+from flask import Blueprint, jsonify, request
+from config import db, cache
+
+bp = Blueprint('cache', __name__)
+
+
+# Drops cached responses, day partials and snapshot days; the backfill and seed jobs
+# call it after rewriting past partitions, which the caches otherwise keep serving.
+# Clearing sends every request back to Hive, so it needs the REPORT_ADMIN_TOKEN
+# secret in the X-Admin-Token header and is disabled when that is not set.
+@bp.route('/api/cache/clear', methods=['POST'])
+def clear():
+    token = os.environ.get('REPORT_ADMIN_TOKEN')
+    if not token or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        error_data = {
+            "code": "403",
+            "status": "error",
+            "type": "message",
+            "value": "Forbidden"
+        }
+        return jsonify(error_data), 403
+
+    cache.clear()
+    db.clear_cached()
+    response_data = {
+        "code": "200",
+        "status": "success",
+        "type": "message",
+        "value": "Caches cleared"
+    }
+    return jsonify(response_data)
@@ -1,13 +1,44 @@
+import os
 from flask import Flask
 from flask_cors import CORS
-from config.database import Database
+from config.database import Database, DuckDBBackend
+from config.cache import ResultCache
+from config.instrumentation import Metrics
 
 
-db = Database(host='hadoop-namenode', port=10000)
+def _backends():
+    # REPORT_BACKEND picks where queries run: "hive" (default) sends everything to Hive,
+    # "duckdb" runs everything on the Parquet export in REPORT_PARQUET_DIR, and "auto"
+    # keeps heavy ranges on Hive while shorter ones run on the export
+    mode = os.environ.get('REPORT_BACKEND', 'hive')
+    if mode == 'hive':
+        return None, None
+    local = DuckDBBackend(parquet_dir=os.environ['REPORT_PARQUET_DIR'])
+    if mode == 'duckdb':
+        return local, None
+    if mode == 'auto':
+        return None, local
+    raise ValueError("Unknown REPORT_BACKEND %r" % mode)
+
+
+# Days, counting today, the ETL may still write to: one-minute micro-batches land late
+# visits in their own day, up to the ETL's --max-lateness-days, which must match.
+# Every cache layer treats them as live and older days as final.
+LIVE_DAYS = 2
+
+# Set REPORT_SNAPSHOT_DIR to serve recent days from a local columnar snapshot
+metrics = Metrics(slow_query_seconds=5, slow_request_seconds=10)
+backend, local_backend = _backends()
+# Per-day partials pay off against Hive job startup; on DuckDB alone the query is cheaper than the merge
+db = Database(host='hadoop-namenode', port=10000, snapshot_dir=os.environ.get('REPORT_SNAPSHOT_DIR'),
+              metrics=metrics, backend=backend, local_backend=local_backend,
+              partials_max_bytes=0 if backend is not None else 64 * 1024 * 1024, live_days=LIVE_DAYS)
+cache = ResultCache(max_entries=256, live_ttl=60, live_days=LIVE_DAYS)
 
 
 def create_app():
     app = Flask(__name__)
+    metrics.init_app(app)
     from sum.sum import bp as sum_bp
     app.register_blueprint(sum_bp)
     from diagnose.diagnose import bp as diagnose_bp
@@ -20,5 +51,11 @@ def create_app():
     app.register_blueprint(gender_bp)
     from faculty.faculty import bp as faculty_bp
     app.register_blueprint(faculty_bp)
+    from dashboard.dashboard import bp as dashboard_bp
+    app.register_blueprint(dashboard_bp)
+    from metrics.metrics import bp as metrics_bp
+    app.register_blueprint(metrics_bp)
+    from cache.cache import bp as cache_bp
+    app.register_blueprint(cache_bp)
     CORS(app)
     return app
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, live_ttl=60, live_days=2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Ranges ending within live_days of today can still change (the ETL appends to
+        # recent day partitions) and expire after live_ttl; older ranges stay until
+        # evicted or cleared, e.g. after a backfill
+        self.live_ttl = live_ttl
+        self.live_days = live_days
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def range_key(endpoint, start_date, end_date):
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return None
+        if end < start:
+            return None
+        return (endpoint, start.isoformat(), end.isoformat())
+
+    def _ttl_for(self, key):
+        end = datetime.strptime(key[2], '%Y-%m-%d').date()
+        if end >= date.today() - timedelta(days=self.live_days - 1):
+            return self.live_ttl
+        return None
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] is not None and entry[3] <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, status, mimetype):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        ttl = self._ttl_for(key)
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, status, mimetype, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[4]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+
+    def cached(self, view=None, vary=()):
+        # Usable as @cache.cached, or @cache.cached(vary=(...)) when extra request
+        # headers select different results for the same range
+        if view is None:
+            return lambda view: self.cached(view, vary)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = self.range_key(request.endpoint,
+                                 request.headers.get('startdate'),
+                                 request.headers.get('enddate'))
+            if key is None:
+                # Invalid ranges fall through to the handler's own validation errors
+                return view(*args, **kwargs)
+            if vary:
+                key = key + tuple(request.headers.get(header, '') for header in vary)
+
+            entry = self.get(key)
+            if entry is not None:
+                body, status, mimetype = entry[:3]
+                return current_app.response_class(body, status=status, mimetype=mimetype)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                self.put(key, response.get_data(), response.status_code, response.mimetype)
+            return response
+        return wrapper
@@ -1,19 +1,571 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from contextlib import contextmanager
+
 from pyhive import hive
+from TCLIService import ttypes
+from TCLIService.ttypes import TOperationState
+import numpy as np
 import pandas as pd
 
-class Database:
-    def __init__(self, host, port):
+from config.instrumentation import Metrics
+from config.partials import DayPartials
+from config.query import rollup_query
+from config.snapshot import SnapshotStore
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality report columns fetched as pandas categoricals
+CATEGORICAL_COLUMNS = ('gender', 'faculty', 'room', 'doctorname', 'diagnose', 'service')
+
+
+def _arrow_type(type_code):
+    if pa is None:
+        return None
+    return {
+        'BOOLEAN_TYPE': pa.bool_(),
+        'TINYINT_TYPE': pa.int64(),
+        'SMALLINT_TYPE': pa.int64(),
+        'INT_TYPE': pa.int64(),
+        'BIGINT_TYPE': pa.int64(),
+        'FLOAT_TYPE': pa.float64(),
+        'DOUBLE_TYPE': pa.float64(),
+        'STRING_TYPE': pa.string(),
+        'VARCHAR_TYPE': pa.string(),
+        'CHAR_TYPE': pa.string(),
+    }.get(type_code)
+
+
+def _column_chunk(column, type_code, type_):
+    if type_ is None:
+        return hive._unwrap_column(column, type_code)
+    wrapper = next(value for value in column.__dict__.values() if value is not None)
+    values = wrapper.values
+    # HiveServer2 marks NULLs in a little-endian bitmap next to the values
+    mask = np.zeros(len(values), dtype=bool)
+    if wrapper.nulls:
+        bits = np.unpackbits(np.frombuffer(wrapper.nulls, dtype=np.uint8), bitorder='little')[:len(values)]
+        mask[:len(bits)] = bits.astype(bool)
+    return pa.array(values, type=type_, mask=mask)
+
+
+def _requested_names(columns, names):
+    # SQL identifiers are case-insensitive and Hive may prefix them with the table;
+    # answer with the names the caller asked for, whatever the backend returned
+    names = {name.lower(): name for name in names}
+    return [names.get(column.split('.')[-1].lower(), column) for column in columns]
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class _PooledConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+
+
+class ConnectionPool:
+    def __init__(self, factory, min_size=1, max_size=10, max_idle=300, max_lifetime=3600,
+                 health_check_interval=30, checkout_timeout=30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size=%s max_size=%s" % (min_size, max_size))
+        self.factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def _expired(self, item, now):
+        return self.max_lifetime is not None and now - item.created_at > self.max_lifetime
+
+    def _healthy(self, item):
+        try:
+            cursor = item.conn.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        item.last_checked = time.monotonic()
+        return True
+
+    def _close_quietly(self, item):
+        try:
+            item.conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self, now):
+        # Called with the lock held; returns the connections to close outside of it
+        evicted = []
+        keep = []
+        for item in self._idle:
+            idle_too_long = self.max_idle is not None and now - item.last_used > self.max_idle
+            if self._expired(item, now) or (idle_too_long and self._size - len(evicted) > self.min_size):
+                evicted.append(item)
+            else:
+                keep.append(item)
+        self._idle = keep
+        self._size -= len(evicted)
+        return evicted
+
+    def acquire(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                evicted = self._evict_idle(time.monotonic())
+                if evicted:
+                    self._cond.notify_all()
+                if self._idle:
+                    item = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    item = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout("Timed out waiting for a database connection")
+                self._cond.wait(remaining)
+
+        for old in evicted:
+            self._close_quietly(old)
+
+        now = time.monotonic()
+        if item is not None and (self._expired(item, now) or (
+                now - item.last_checked > self.health_check_interval and not self._healthy(item))):
+            self._close_quietly(item)
+            item = None
+
+        if item is None:
+            try:
+                item = _PooledConnection(self.factory())
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return item
+
+    def release(self, item, broken=False):
+        now = time.monotonic()
+        with self._cond:
+            if broken or self._closed or self._expired(item, now):
+                self._size -= 1
+                discard = True
+            else:
+                item.last_used = now
+                if broken is None:
+                    # Unknown state after a failed query: re-check before the next checkout
+                    item.last_checked = 0
+                self._idle.append(item)
+                discard = False
+            self._cond.notify()
+        if discard:
+            self._close_quietly(item)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        item = self.acquire(timeout)
+        completed = False
+        try:
+            yield item.conn
+            completed = True
+        finally:
+            # A failed or abandoned checkout (e.g. a closed streaming generator) leaves the
+            # connection in an unknown state, so it is health-checked before reuse
+            self.release(item, broken=False if completed else None)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for item in idle:
+            self._close_quietly(item)
+
+
+class HiveBackend:
+    # HiveServer2 over PyHive: every query is a Hive job
+    name = 'hive'
+
+    def __init__(self, host, port, fetch_size=10000, categorical_columns=CATEGORICAL_COLUMNS):
         self.host = host
         self.port = port
+        self.fetch_size = fetch_size
+        self.categorical_columns = {column.lower() for column in categorical_columns}
 
-    @property
     def connect(self):
         return hive.Connection(host=self.host, port=self.port)
 
-    def execute_query(self, query):
-        conn = self.connect
-        df = pd.read_sql(query, conn)
-        conn.close()
-        return df
+    def execute(self, cursor, query, cancelled, deadline=None):
+        # Run asynchronously on HiveServer2 and poll, so the operation can be cancelled
+        # from this thread without sharing the Thrift transport
+        cursor.execute(query, async_=True)
+        delay = 0.05
+        while True:
+            status = cursor.poll(get_progress_update=False)
+            state = status.operationState
+            if state == TOperationState.FINISHED_STATE:
+                return
+            if state not in (TOperationState.INITIALIZED_STATE, TOperationState.PENDING_STATE,
+                             TOperationState.RUNNING_STATE):
+                raise hive.OperationalError(status.errorMessage or
+                                            TOperationState._VALUES_TO_NAMES.get(state, str(state)))
+            if deadline is not None and time.monotonic() >= deadline:
+                cursor.cancel()
+                raise QueryTimeout("Query exceeded its deadline and was cancelled")
+            if cancelled.wait(delay):
+                cursor.cancel()
+                raise QueryCancelled("Query was cancelled")
+            delay = min(delay * 2, 1.0)
+
+    def _fetch_batches(self, cursor, types):
+        # Yields one list of column chunks per fetched batch: Arrow arrays for typed
+        # columns, Python lists for the ones left to pandas' inference
+        if hasattr(cursor, '_operationHandle'):
+            # PyHive already receives columnar data from HiveServer2; read it directly
+            # rather than letting the cursor zip it into row tuples
+            request = ttypes.TFetchResultsReq(operationHandle=cursor._operationHandle,
+                                              orientation=ttypes.TFetchOrientation.FETCH_NEXT,
+                                              maxRows=self.fetch_size)
+            while True:
+                response = cursor._connection.client.FetchResults(request)
+                hive._check_status(response)
+                batch = [_column_chunk(column, type_code, type_)
+                         for column, (type_code, type_) in zip(response.results.columns, types)]
+                if not batch or len(batch[0]) == 0:
+                    return
+                yield batch
+        else:
+            cursor.arraysize = self.fetch_size
+            while True:
+                rows = cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    return
+                yield [pa.array(values, type=type_) if type_ is not None else list(values)
+                       for values, (_, type_) in zip(zip(*rows), types)]
+
+    def fetch_frame(self, cursor):
+        # Fetch in large batches and assemble typed columns, instead of materializing
+        # every row as a tuple of Python objects
+        description = cursor.description
+        names = [column[0] for column in description]
+        if pa is None:
+            return pd.DataFrame.from_records(cursor.fetchall(), columns=names, coerce_float=True)
+
+        type_codes = [column[1] if len(column) > 1 else None for column in description]
+        types = [(type_code, _arrow_type(type_code)) for type_code in type_codes]
+        chunks = [[] for _ in names]
+        for batch in self._fetch_batches(cursor, types):
+            for index, chunk in enumerate(batch):
+                if types[index][1] is None:
+                    chunks[index].extend(chunk)
+                else:
+                    chunks[index].append(chunk)
+
+        columns = {}
+        for name, (_, type_), chunk in zip(names, types, chunks):
+            if type_ is None:
+                # Decimals, timestamps and complex types keep pandas' own inference
+                columns[name] = pd.Series(chunk, dtype=object if not chunk else None)
+                continue
+            array = pa.chunked_array(chunk, type=type_)
+            if pa.types.is_string(type_) and name.split('.')[-1].lower() in self.categorical_columns:
+                array = array.dictionary_encode()
+            columns[name] = array.to_pandas()
+        return pd.DataFrame(columns, columns=names)
+
+
+class DuckDBBackend:
+    # Embedded DuckDB over the Parquet export of the report tables, laid out as
+    # <parquet_dir>/<table>/year=YYYY/month=MM/day=DD/*.parquet. Each table is exposed
+    # as a view under its Hive name, so the same SQL runs on both backends without a
+    # job startup. Without parquet_dir the database starts empty (e.g. for benchmarks).
+    name = 'duckdb'
+
+    def __init__(self, path=':memory:', parquet_dir=None, categorical_columns=CATEGORICAL_COLUMNS):
+        if duckdb is None or pa is None:
+            raise RuntimeError("duckdb and pyarrow are required for the embedded query backend")
+        self.database = duckdb.connect(path)
+        self.categorical_columns = {column.lower() for column in categorical_columns}
+        if parquet_dir:
+            self._create_views(parquet_dir)
+
+    def _create_views(self, parquet_dir):
+        for table in sorted(os.listdir(parquet_dir)):
+            schema = table.split('.')[0] if '.' in table else None
+            # Only committed partition files: Spark writes in-flight output under
+            # _temporary/ and .spark-staging-*/, which a recursive glob would read
+            pattern = os.path.join(parquet_dir, table, 'year=*', 'month=*', 'day=*',
+                                   '*.parquet').replace("'", "''")
+            try:
+                if schema:
+                    self.database.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+                # Partition values stay strings, as they are in Hive
+                self.database.execute(
+                    f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet('{pattern}', "
+                    f"hive_partitioning = true, "
+                    f"hive_types = {{'year': VARCHAR, 'month': VARCHAR, 'day': VARCHAR}})")
+            except duckdb.Error:
+                logger.exception("Skipping Parquet export %s", table)
+
+    def connect(self):
+        # Cursors are separate connections to the same in-process database
+        return self.database.cursor()
+
+    def execute(self, cursor, query, cancelled, deadline=None):
+        cursor.execute(query)
+
+    def fetch_frame(self, cursor):
+        table = cursor.arrow()
+        if isinstance(table, pa.RecordBatchReader):
+            # Newer DuckDB releases return a reader rather than a table
+            table = table.read_all()
+        columns = []
+        for name, column in zip(table.column_names, table.columns):
+            if pa.types.is_decimal(column.type) and column.type.scale == 0:
+                # DuckDB sums integers into HUGEINT; Hive returns BIGINT
+                column = column.cast(pa.int64())
+            elif ((pa.types.is_string(column.type) or pa.types.is_large_string(column.type))
+                    and name.split('.')[-1].lower() in self.categorical_columns):
+                column = column.dictionary_encode()
+            columns.append(column)
+        return pa.table(columns, names=table.column_names).to_pandas()
+
+
+class _Flight:
+    # One query in flight, shared by every caller that asked for the same SQL meanwhile
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+        self.future = None
+        self.waiters = 1
+        self.shared = False
+
+
+class Database:
+    def __init__(self, host, port, pool_min_size=1, pool_max_size=10, pool_max_idle=300,
+                 pool_max_lifetime=3600, pool_timeout=30, query_workers=8, heavy_query_workers=2,
+                 heavy_range_days=92, query_timeout=300, snapshot_dir=None, snapshot_days=90,
+                 fetch_size=10000, categorical_columns=CATEGORICAL_COLUMNS, metrics=None,
+                 backend=None, local_backend=None, partials_max_bytes=64 * 1024 * 1024, live_days=2):
+        self.host = host
+        self.port = port
+        self.backend = backend if backend is not None else HiveBackend(host, port, fetch_size, categorical_columns)
+        self.pool = ConnectionPool(self.backend.connect,
+                                   min_size=pool_min_size,
+                                   max_size=pool_max_size,
+                                   max_idle=pool_max_idle,
+                                   max_lifetime=pool_max_lifetime,
+                                   checkout_timeout=pool_timeout)
+        # Optional second backend for queries that are not heavy, e.g. DuckDB for short
+        # dashboard ranges while long ranges still go to Hive
+        self.local_backend = local_backend
+        self.local_pool = None
+        if local_backend is not None:
+            self.local_pool = ConnectionPool(local_backend.connect,
+                                             min_size=0,
+                                             max_size=query_workers,
+                                             max_idle=pool_max_idle,
+                                             max_lifetime=None,
+                                             checkout_timeout=pool_timeout)
+        # Long ranges run on their own small executor so a few multi-minute scans
+        # cannot take every worker away from the cheap dashboard queries
+        self.executor = ThreadPoolExecutor(max_workers=query_workers, thread_name_prefix='hive-query')
+        self.heavy_executor = ThreadPoolExecutor(max_workers=heavy_query_workers,
+                                                 thread_name_prefix='hive-heavy-query')
+        self.heavy_range_days = heavy_range_days
+        self.query_timeout = query_timeout
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        # Per-day rollup results, merged in memory so ranges only query missing days
+        # live_days: recent days the ETL may still write to, never held as final
+        self.partials = DayPartials(max_bytes=partials_max_bytes, live_days=live_days) \
+            if partials_max_bytes else None
+        self.snapshot = None
+        if snapshot_dir:
+            self.snapshot = SnapshotStore(snapshot_dir, days=snapshot_days, live_days=live_days)
+            self.snapshot.start(self)
+
+    def is_heavy_range(self, start, end):
+        return (end - start).days + 1 > self.heavy_range_days
+
+    def _run_query(self, query, cancelled, collector=None, local=False):
+        if local:
+            try:
+                return self._run_backend(self.local_backend, self.local_pool, query, cancelled, collector)
+            except Exception:
+                # e.g. a table not exported yet; the primary backend still has it
+                logger.warning("%s backend failed, retrying on %s", self.local_backend.name,
+                               self.backend.name, exc_info=True)
+        return self._run_backend(self.backend, self.pool, query, cancelled, collector)
+
+    def _run_backend(self, backend, pool, query, cancelled, collector):
+        started = time.perf_counter()
+        with pool.connection() as conn:
+            connected = time.perf_counter()
+            self.metrics.record('connect', connected - started, collector)
+            cursor = conn.cursor()
+            try:
+                backend.execute(cursor, query, cancelled)
+                executed = time.perf_counter()
+                self.metrics.record('execute', executed - connected, collector)
+                frame = backend.fetch_frame(cursor)
+                fetched = time.perf_counter()
+                self.metrics.record('fetch', fetched - executed, collector)
+            finally:
+                cursor.close()
+
+        self.metrics.count('rows_fetched', len(frame), collector)
+        self.metrics.count('bytes_fetched', int(frame.memory_usage(index=False).sum()), collector)
+        if fetched - connected > self.metrics.slow_query_seconds:
+            self.metrics.slow_query(query, executed - connected, fetched - executed, len(frame))
+        return frame
+
+    def _run_flight(self, key, flight, query, collector, local):
+        try:
+            return self._run_query(query, flight.cancelled, collector, local)
+        finally:
+            # Leave the table before the result is published, so nobody joins a
+            # finished flight and flight.shared is final once the future is done
+            with self._flights_lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def execute_query(self, query, timeout=None, heavy=False):
+        # Identical SQL already in flight is awaited instead of submitted again; each
+        # caller keeps its own timeout and gets the same result or exception
+        timeout = self.query_timeout if timeout is None else timeout
+        executor = self.heavy_executor if heavy else self.executor
+        collector = self.metrics.collector()
+        started = time.perf_counter()
+        local = self.local_backend is not None and not heavy
+        key = (query, local)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(threading.Event())
+                flight.future = executor.submit(self._run_flight, key, flight, query, collector, local)
+            else:
+                flight.waiters += 1
+                flight.shared = True
+                self.metrics.count('coalesced_queries', 1, collector)
+        try:
+            frame = flight.future.result(timeout=timeout)
+            # Callers post-process their frame, so a shared result is copied per caller
+            return frame.copy() if flight.shared else frame
+        except FuturesTimeout:
+            raise QueryTimeout("Query exceeded %ss and was cancelled" % timeout)
+        finally:
+            self.metrics.record('query_wait', time.perf_counter() - started, collector)
+            with self._flights_lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0 and not flight.future.done()
+                if abandoned and self._flights.get(key) is flight:
+                    del self._flights[key]
+            # The last waiter timed out or went away: stop the HiveServer2 operation
+            if abandoned:
+                flight.cancelled.set()
+                flight.future.cancel()
+
+    def stream_query(self, query, batch_size=1000, columns=()):
+        # Yields rows as dicts while holding a pooled connection, so callers can
+        # serialize results without materializing them. Closing the generator (the
+        # client disconnected) closes the cursor and with it the Hive operation.
+        # Keys are named as in columns where they match case-insensitively.
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self.backend.execute(cursor, query, threading.Event(),
+                                     deadline=time.monotonic() + self.query_timeout)
+                names = _requested_names([column[0] for column in cursor.description], columns)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(zip(names, row))
+            finally:
+                cursor.close()
+
+    def read_rollup(self, table, keys, measures, start, end):
+        # Every path answers with the key and alias names as given, so the response
+        # shape does not depend on the backend or on which path served it
+        if self.snapshot is not None and self.snapshot.covers(table, start, end):
+            started = time.perf_counter()
+            data = self.snapshot.read(table, keys, measures, start, end)
+            elapsed = time.perf_counter() - started
+            collector = self.metrics.collector()
+            self.metrics.record('snapshot', elapsed, collector)
+            self.metrics.record('query_wait', elapsed, collector)
+        elif self.partials is not None:
+            data = self.partials.read(self, table, keys, measures, start, end)
+        else:
+            data = self.execute_query(rollup_query(table, keys, measures, start, end),
+                                      heavy=self.is_heavy_range(start, end))
+        data.columns = _requested_names(data.columns, list(keys) + list(measures))
+        return data
+
+    def clear_cached(self):
+        # Drop the day partials and snapshot days, so rewritten partitions are read again
+        if self.partials is not None:
+            self.partials.clear()
+        if self.snapshot is not None:
+            self.snapshot.clear()
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.heavy_executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
+        if self.local_pool is not None:
+            self.local_pool.close()
 
 # Instantiate the Database object here
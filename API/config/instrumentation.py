@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(**labels):
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in labels.items()) + '}'
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    metrics = None
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            self.metrics.record('serialize', time.perf_counter() - started, self.metrics.collector())
+
+
+class Metrics:
+    # In-process request and query metrics, exported in the Prometheus text format.
+    # Database work runs on executor threads without Flask's context, so it records
+    # into the collector of the request that submitted it.
+    def __init__(self, slow_query_seconds=5, slow_request_seconds=10):
+        self.slow_query_seconds = slow_query_seconds
+        self.slow_request_seconds = slow_request_seconds
+        self._lock = threading.Lock()
+        self._latency = defaultdict(_Histogram)
+        self._phases = defaultdict(_Histogram)
+        self._requests = defaultdict(int)
+        self._counters = defaultdict(int)
+
+    def collector(self):
+        if has_request_context():
+            return g.get('metrics')
+        return None
+
+    def record(self, phase, seconds, collector=None):
+        if collector is not None:
+            collector['phases'][phase] = collector['phases'].get(phase, 0.0) + seconds
+            return
+        with self._lock:
+            self._phases[('background', phase)].observe(seconds)
+
+    def count(self, name, value, collector=None):
+        if collector is not None:
+            collector['counts'][name] = collector['counts'].get(name, 0) + value
+            return
+        with self._lock:
+            self._counters[('background', name)] += value
+
+    def slow_query(self, query, execute_seconds, fetch_seconds, rows):
+        with self._lock:
+            self._counters[('', 'slow_queries')] += 1
+        logger.warning("Slow query: %.2fs execute, %.2fs fetch, %d rows: %s",
+                       execute_seconds, fetch_seconds, rows, query)
+
+    def _before_request(self):
+        g.metrics = {'started': time.perf_counter(), 'phases': {}, 'counts': {}}
+
+    def _after_request(self, response):
+        collector = g.get('metrics')
+        if collector is None:
+            return response
+        total = time.perf_counter() - collector['started']
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        phases = collector['phases']
+        waited = phases.pop('query_wait', 0.0)
+        # What is left of the view time once the query wait and serialization are taken
+        # out is the pandas post-processing. Streamed bodies are serialized after this
+        # point, so their serialization is not part of the view time.
+        phases['transform'] = max(total - waited - phases.get('serialize', 0.0), 0.0)
+
+        with self._lock:
+            self._latency[(route, request.method)].observe(total)
+            self._requests[(route, request.method, response.status_code)] += 1
+            for phase, seconds in phases.items():
+                self._phases[(route, phase)].observe(seconds)
+            for name, value in collector['counts'].items():
+                self._counters[(route, name)] += value
+
+        if total > self.slow_request_seconds:
+            logger.warning("Slow request %s %s: %.2fs (%s)", request.method, request.path, total,
+                           ', '.join('%s %.3fs' % item for item in sorted(phases.items())))
+        return response
+
+    def init_app(self, app):
+        provider = _TimedJSONProvider(app)
+        provider.metrics = self
+        app.json = provider
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def render(self, cache=None):
+        lines = []
+        with self._lock:
+            lines.append('# HELP report_request_duration_seconds Request latency per route')
+            lines.append('# TYPE report_request_duration_seconds histogram')
+            for (route, method), histogram in sorted(self._latency.items()):
+                lines.extend(self._render_histogram('report_request_duration_seconds', histogram,
+                                                    route=route, method=method))
+
+            lines.append('# HELP report_requests_total Requests per route and status')
+            lines.append('# TYPE report_requests_total counter')
+            for (route, method, status), value in sorted(self._requests.items()):
+                lines.append('report_requests_total%s %d' % (_labels(route=route, method=method, status=status),
+                                                            value))
+
+            lines.append('# HELP report_phase_duration_seconds Time per request phase and route')
+            lines.append('# TYPE report_phase_duration_seconds histogram')
+            for (route, phase), histogram in sorted(self._phases.items()):
+                lines.extend(self._render_histogram('report_phase_duration_seconds', histogram,
+                                                    route=route, phase=phase))
+
+            for name, help_text in (('rows_fetched', 'Rows fetched from Hive'),
+                                    ('bytes_fetched', 'In-memory size of the frames fetched from Hive'),
+                                    ('slow_queries', 'Queries slower than the slow query threshold'),
+                                    ('coalesced_queries', 'Queries answered by an identical query in flight'),
+                                    ('partial_days_cached', 'Days of rollup reads answered from the day partials'),
+                                    ('partial_days_fetched', 'Days of rollup reads that had to be queried')):
+                lines.append('# HELP report_%s_total %s' % (name, help_text))
+                lines.append('# TYPE report_%s_total counter' % name)
+                for (route, counter), value in sorted(self._counters.items()):
+                    if counter == name:
+                        labels = _labels(route=route) if route else ''
+                        lines.append('report_%s_total%s %d' % (name, labels, value))
+
+        if cache is not None:
+            stats = cache.stats()
+            lines.append('# HELP report_cache_requests_total Result cache lookups')
+            lines.append('# TYPE report_cache_requests_total counter')
+            lines.append('report_cache_requests_total{result="hit"} %d' % stats['hits'])
+            lines.append('report_cache_requests_total{result="miss"} %d' % stats['misses'])
+            lines.append('# HELP report_cache_entries Responses held in the result cache')
+            lines.append('# TYPE report_cache_entries gauge')
+            lines.append('report_cache_entries %d' % stats['entries'])
+            lines.append('# HELP report_cache_bytes Size of the responses held in the result cache')
+            lines.append('# TYPE report_cache_bytes gauge')
+            lines.append('report_cache_bytes %d' % stats['bytes'])
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(name, histogram, **labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (name, _labels(**labels, le=bound), cumulative))
+        lines.append('%s_sum%s %f' % (name, _labels(**labels), histogram.sum))
+        lines.append('%s_count%s %d' % (name, _labels(**labels), histogram.count))
+        return lines
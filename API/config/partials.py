@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from config.query import as_date, daily_rollup_query
+
+PARTITION_COLUMNS = ('year', 'month', 'day')
+
+
+class DayPartials:
+    # Per-day results of rollup reads. A range is answered by merging the days already
+    # held and querying only the missing ones, so sliding a 30-day window forward
+    # fetches a single day. Days within live_days of today are always fetched, since
+    # the ETL may still be appending to them.
+    def __init__(self, max_bytes=64 * 1024 * 1024, live_days=2):
+        self.max_bytes = max_bytes
+        self.live_days = live_days
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key, frame, size):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (frame, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                self._bytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _fetch(self, db, table, keys, measures, days):
+        data = db.execute_query(daily_rollup_query(table, keys, measures, days),
+                                heavy=len(days) > db.heavy_range_days)
+        # Identifiers are case-insensitive in SQL but not in pandas: name the columns
+        # as requested, whatever case the backend returns them in
+        names = {name.lower(): name for name in PARTITION_COLUMNS + tuple(keys) + tuple(measures)}
+        data = data.rename(columns={column: names[column.split('.')[-1].lower()] for column in data.columns
+                                    if column.split('.')[-1].lower() in names})
+        labels = (data['year'].astype(str) + '-' + data['month'].astype(str) + '-'
+                  + data['day'].astype(str)).to_numpy()
+
+        # Split into days with one sort and contiguous slices; a pandas groupby per day
+        # costs more than the query saves on long ranges. Each slice is copied, since a
+        # view would keep the whole fetched frame alive in the cache.
+        order = np.argsort(labels, kind='stable')
+        labels = labels[order]
+        data = data.drop(columns=list(PARTITION_COLUMNS)).iloc[order].reset_index(drop=True)
+        found, starts = np.unique(labels, return_index=True)
+        ends = np.append(starts[1:], len(data))
+        parts = {label: data.iloc[start:end].copy()
+                 for label, start, end in zip(found, starts, ends)}
+        empty = data.iloc[0:0].copy()
+        return {day: parts.get(day.strftime('%Y-%m-%d'), empty) for day in days}
+
+    def read(self, db, table, keys, measures, start, end):
+        start, end = as_date(start), as_date(end)
+        live_start = date.today() - timedelta(days=self.live_days - 1)
+        prefix = (table, tuple(keys), tuple(measures.items()))
+
+        frames = []
+        missing = []
+        day = start
+        while day <= end:
+            frame = self._get(prefix + (day,))
+            if frame is None:
+                missing.append(day)
+            else:
+                frames.append(frame)
+            day += timedelta(days=1)
+
+        collector = db.metrics.collector()
+        db.metrics.count('partial_days_cached', len(frames), collector)
+        db.metrics.count('partial_days_fetched', len(missing), collector)
+        if missing:
+            for day, frame in self._fetch(db, table, keys, measures, missing).items():
+                if day < live_start:
+                    self._put(prefix + (day,), frame, int(frame.memory_usage(index=False, deep=True).sum()))
+                frames.append(frame)
+
+        values = list(measures)
+        frames = [frame for frame in frames if not frame.empty]
+        if not keys:
+            return pd.DataFrame([{alias: int(sum(frame[alias].fillna(0).sum() for frame in frames))
+                                  for alias in values}])
+        if not frames:
+            return pd.DataFrame(columns=list(keys) + values)
+        data = pd.concat(frames, ignore_index=True)
+        for key in keys:
+            if isinstance(data[key].dtype, pd.CategoricalDtype):
+                # Categories come in first-seen order; sort them so grouping and sorting
+                # here and in the handlers follow the values, as the query's ORDER BY does
+                data[key] = pd.Categorical(data[key].astype(object))
+        return data.groupby(list(keys), as_index=False, observed=True)[values].sum() \
+            .sort_values(list(keys)).reset_index(drop=True)
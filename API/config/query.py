@@ -0,0 +1,76 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+
+def as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def partition_filter(start, end):
+    # year/month/day are zero-padded string partitions, so compare against string
+    # literals only: fully covered years and months collapse to a single clause and
+    # Hive can prune every partition outside the list.
+    start, end = as_date(start), as_date(end)
+    if end < start:
+        raise ValueError("End date cannot be earlier than start date")
+
+    clauses = []
+    for year in range(start.year, end.year + 1):
+        year_start = max(start, date(year, 1, 1))
+        year_end = min(end, date(year, 12, 31))
+        if year_start == date(year, 1, 1) and year_end == date(year, 12, 31):
+            clauses.append(f"year = '{year:04d}'")
+            continue
+
+        full_months = []
+        for month in range(year_start.month, year_end.month + 1):
+            last_day = calendar.monthrange(year, month)[1]
+            month_start = max(year_start, date(year, month, 1))
+            month_end = min(year_end, date(year, month, last_day))
+            if month_start.day == 1 and month_end.day == last_day:
+                full_months.append(f"'{month:02d}'")
+                continue
+            days = ", ".join(f"'{day:02d}'" for day in range(month_start.day, month_end.day + 1))
+            clauses.append(f"(year = '{year:04d}' AND month = '{month:02d}' AND day IN ({days}))")
+
+        if full_months:
+            clauses.append(f"(year = '{year:04d}' AND month IN ({', '.join(full_months)}))")
+
+    return "(" + " OR ".join(clauses) + ")"
+
+
+def days_filter(days):
+    # Partition filter for any set of days; each run of consecutive days collapses
+    # the same way a range does
+    runs = []
+    for day in sorted(as_date(day) for day in days):
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return "(" + " OR ".join(partition_filter(start, end) for start, end in runs) + ")"
+
+
+def _rollup_select(table, keys, measures, where, ordered):
+    select = list(keys) + [f"COALESCE(SUM({column}), 0) AS {alias}" for alias, column in measures.items()]
+    query = f"SELECT {', '.join(select)} FROM {table} WHERE {where}"
+    for key in keys:
+        query += f" AND {key} IS NOT NULL"
+    if keys:
+        query += f" GROUP BY {', '.join(keys)}"
+        if ordered:
+            query += f" ORDER BY {', '.join(keys)}"
+    return query
+
+
+def rollup_query(table, keys, measures, start, end, ordered=True):
+    # keys: grouping columns, measures: {output alias: rollup column}. Rollup rows
+    # are per-day partials, so every measure is summed across the requested days.
+    return _rollup_select(table, keys, measures, partition_filter(start, end), ordered)
+
+
+def daily_rollup_query(table, keys, measures, days):
+    # The same sums kept apart per day, for the given (not necessarily consecutive) days
+    return _rollup_select(table, ['year', 'month', 'day'] + list(keys), measures, days_filter(days), False)
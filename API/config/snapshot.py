@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+from datetime import date, timedelta
+
+import pandas as pd
+
+from config.query import as_date, days_filter
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Columns kept per rollup table, besides the year/month/day partitions
+ROLLUP_COLUMNS = {
+    'report.rollup_patients': ['patient_count'],
+    'report.rollup_doctor': ['DoctorName', 'patient_count'],
+    'report.rollup_faculty_diagnose': ['Faculty', 'Diagnose', 'patient_count'],
+    'report.rollup_service': ['Room', 'Service', 'Gender', 'service_count'],
+    'report.rollup_age': ['Diagnose', 'age_bucket', 'patient_count', 'age_count', 'age_sum'],
+}
+
+
+class SnapshotStore:
+    # Local Arrow IPC copy of the most recent day partitions of the rollup tables,
+    # one file per table and day, memory-mapped on read. Recent days are re-fetched on
+    # every refresh because the ETL may still be appending to them.
+    def __init__(self, directory, tables=None, days=90, live_days=2, refresh_interval=300):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the local snapshot cache")
+        self.directory = directory
+        self.tables = dict(ROLLUP_COLUMNS if tables is None else tables)
+        self.days = days
+        self.live_days = live_days
+        self.refresh_interval = refresh_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def window(self):
+        today = date.today()
+        return today - timedelta(days=self.days - 1), today
+
+    def _path(self, table, day):
+        return os.path.join(self.directory, table, day.isoformat() + '.arrow')
+
+    def covers(self, table, start, end):
+        if table not in self.tables:
+            return False
+        start, end = as_date(start), as_date(end)
+        window_start, window_end = self.window()
+        if start < window_start or end > window_end:
+            return False
+        day = start
+        while day <= end:
+            if not os.path.exists(self._path(table, day)):
+                return False
+            day += timedelta(days=1)
+        return True
+
+    def _read_day(self, table, day):
+        with pa.memory_map(self._path(table, day), 'r') as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+
+    def read(self, table, keys, measures, start, end):
+        start, end = as_date(start), as_date(end)
+        frames = []
+        day = start
+        while day <= end:
+            frames.append(self._read_day(table, day))
+            day += timedelta(days=1)
+        data = pd.concat(frames, ignore_index=True)
+
+        # Hive identifiers are case-insensitive, pandas columns are not
+        columns = {column.lower(): column for column in data.columns}
+        data = data.rename(columns={columns[key.lower()]: key for key in keys})
+        data = data.rename(columns={columns[column.lower()]: alias for alias, column in measures.items()})
+        values = list(measures)
+        if not keys:
+            return pd.DataFrame([{alias: int(data[alias].fillna(0).sum()) for alias in values}])
+        data = data.dropna(subset=keys)
+        for key in keys:
+            if isinstance(data[key].dtype, pd.CategoricalDtype):
+                # Day files hold dictionary columns whose categories come in first-seen
+                # order; sort them so grouping and sorting follow the values, as the
+                # query's ORDER BY does
+                data[key] = pd.Categorical(data[key].astype(object))
+        return data.groupby(keys, as_index=False, observed=True)[values].sum() \
+            .sort_values(keys).reset_index(drop=True)
+
+    def _write_day(self, table, day, frame):
+        path = self._path(table, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrow_table = pa.Table.from_pandas(frame.reset_index(drop=True), preserve_index=False)
+        tmp_path = path + '.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                writer.write_table(arrow_table)
+        os.replace(tmp_path, path)
+
+    def refresh_table(self, db, table):
+        window_start, window_end = self.window()
+        live_start = window_end - timedelta(days=self.live_days - 1)
+        stale = []
+        day = window_start
+        while day <= window_end:
+            if day >= live_start or not os.path.exists(self._path(table, day)):
+                stale.append(day)
+            day += timedelta(days=1)
+
+        if stale:
+            columns = self.tables[table]
+            query = (f"SELECT year, month, day, {', '.join(columns)} FROM {table} "
+                     f"WHERE {days_filter(stale)}")
+            data = db.execute_query(query, heavy=True)
+            data = data.rename(columns={column.lower(): column for column in columns})
+            keys = data['year'].astype(str) + '-' + data['month'].astype(str) + '-' + data['day'].astype(str)
+            for day in stale:
+                # Days without visits are written empty so they still count as covered
+                self._write_day(table, day, data.loc[keys == day.strftime('%Y-%m-%d'), columns])
+
+        # Drop days that have left the window
+        table_dir = os.path.join(self.directory, table)
+        for name in os.listdir(table_dir) if os.path.isdir(table_dir) else []:
+            try:
+                day = date.fromisoformat(name.split('.')[0])
+            except ValueError:
+                continue
+            if day < window_start:
+                os.remove(os.path.join(table_dir, name))
+
+    def clear(self):
+        # Forget every stored day, e.g. after a backfill rewrote past partitions;
+        # reads fall through to the database until the next refresh
+        for table in self.tables:
+            table_dir = os.path.join(self.directory, table)
+            for name in os.listdir(table_dir) if os.path.isdir(table_dir) else []:
+                os.remove(os.path.join(table_dir, name))
+
+    def refresh(self, db):
+        for table in self.tables:
+            try:
+                self.refresh_table(db, table)
+            except Exception:
+                logger.exception("Snapshot refresh failed for %s", table)
+
+    def start(self, db):
+        def run():
+            while not self._stop.is_set():
+                self.refresh(db)
+                self._stop.wait(self.refresh_interval)
+
+        self._thread = threading.Thread(target=run, name='snapshot-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,38 @@
+from flask import current_app, request
+
+
+def streaming_requested():
+    return request.headers.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_records(records, chunk_size=500, **envelope):
+    # Serializes records incrementally inside the usual response envelope. Returns
+    # None when there are no records so the caller can still answer 404.
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return None
+
+    dumps = current_app.json.dumps
+    envelope = dict(code="200", status="success", type="message", **envelope)
+    prefix = dumps(envelope)[:-1] + ', "value": ['
+
+    def generate():
+        try:
+            yield prefix + dumps(first)
+            chunk = []
+            for record in records:
+                chunk.append(dumps(record))
+                if len(chunk) >= chunk_size:
+                    yield ', ' + ', '.join(chunk)
+                    chunk = []
+            if chunk:
+                yield ', ' + ', '.join(chunk)
+            yield ']}'
+        finally:
+            # Release the cursor and pooled connection if the client goes away early
+            close = getattr(records, 'close', None)
+            if close is not None:
+                close()
+
+    return current_app.response_class(generate(), mimetype='application/json')
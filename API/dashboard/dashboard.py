@@ -0,0 +1,185 @@
+import pandas as pd
+from flask import Blueprint, jsonify, request
+from config import db, cache
+from config.database import QueryTimeout
+from config.query import partition_filter
+from datetime import datetime
+
+bp = Blueprint('dashboard', __name__)
+
+
+def validate_date(date_str):
+    try:
+        datetime.strptime(date_str, '%Y-%m-%d')
+        return True
+    except ValueError:
+        return False
+
+
+def total_patients(data):
+    total = int(data['value'].fillna(0).sum())
+    return {"total_patients": total}
+
+
+def counts(value_name):
+    def shape(data):
+        return data.rename(columns={'value': value_name}).to_dict(orient='records')
+    return shape
+
+
+def service_gender(data):
+    if data.empty:
+        return []
+    pivot_table = pd.pivot_table(data, index='Service', columns='Gender', values='value',
+                                 aggfunc='sum', fill_value=0)
+    return pivot_table.reset_index().to_dict(orient='records')
+
+
+def rate_of_patients_disease(data):
+    data = data.rename(columns={'value': 'PatientCount'})
+    data['TotalPatients'] = data.groupby('Faculty')['PatientCount'].transform('sum')
+    data['DiseaseRate'] = data['PatientCount'] / data['TotalPatients']
+    return data.to_dict(orient='records')
+
+
+def most_common_disease(data):
+    data = data.rename(columns={'value': 'PatientCount'})
+    if data.empty:
+        return []
+    return data.loc[data.groupby('Faculty')['PatientCount'].idxmax()].reset_index(drop=True).to_dict(orient='records')
+
+
+# metric name: (rollup table, grouping keys, summed column, payload shaper); the
+# payload of each metric matches the "value" of the endpoint with the same name
+METRICS = {
+    'sumpatient': ('report.rollup_patients', [], 'patient_count', total_patients),
+    'sum_patient_doctor': ('report.rollup_doctor', ['DoctorName'], 'patient_count', counts('PatientCount')),
+    'sum_patient_faculty': ('report.rollup_faculty_diagnose', ['faculty'], 'patient_count',
+                            counts('PatientCount')),
+    'rate_of_patients_disease': ('report.rollup_faculty_diagnose', ['Faculty', 'Diagnose'], 'patient_count',
+                                 rate_of_patients_disease),
+    'most_common_disease': ('report.rollup_faculty_diagnose', ['Faculty', 'Diagnose'], 'patient_count',
+                            most_common_disease),
+    'sumserviceroom': ('report.rollup_service', ['room'], 'service_count', counts('total_service')),
+    'sumservice': ('report.rollup_service', ['Service'], 'service_count', counts('total')),
+    'service_gender': ('report.rollup_service', ['Service', 'Gender'], 'service_count', service_gender),
+}
+
+
+def batch_query(metrics, start, end):
+    # One UNION ALL over the daily rollups answers every requested metric in a single
+    # Hive job; each branch only reads the pre-aggregated partitions of its rollup, and
+    # metrics with the same grouping share a branch. Returns the query and the branch
+    # tag of each metric.
+    where = partition_filter(start, end)
+    branches = []
+    tags = {}
+    groupings = {}
+    for name in metrics:
+        table, keys, column, _ = METRICS[name]
+        grouping = (table, tuple(keys), column)
+        if grouping in groupings:
+            tags[name] = groupings[grouping]
+            continue
+        tags[name] = groupings[grouping] = name
+        key_columns = [f"CAST({key} AS STRING)" for key in keys] + ["CAST(NULL AS STRING)"] * (2 - len(keys))
+        branch = (f"SELECT '{name}' AS metric, {key_columns[0]} AS key1, {key_columns[1]} AS key2, "
+                  f"SUM({column}) AS metric_value FROM {table} WHERE {where}")
+        for key in keys:
+            branch += f" AND {key} IS NOT NULL"
+        if keys:
+            branch += f" GROUP BY {', '.join(keys)}"
+        branches.append(branch)
+    query = ("SELECT metric, key1, key2, metric_value AS value FROM ("
+             + " UNION ALL ".join(branches) + ") batch")
+    return query, tags
+
+
+@bp.route('/api/dashboard/batch', methods=['GET'])
+@cache.cached(vary=('metrics',))
+def batch():
+    try:
+        start_date = request.headers.get('startdate')
+        end_date = request.headers.get('enddate')
+        metrics = [name.strip() for name in request.headers.get('metrics', '').split(',') if name.strip()]
+
+        if not start_date or not validate_date(start_date):
+            error_data = {
+                "code": "400",
+                "status": "error",
+                "type": "message",
+                "value": "Invalid or missing start_date. Format should be YYYY-MM-DD"
+            }
+            return jsonify(error_data), 400
+        if not end_date or not validate_date(end_date):
+            error_data = {
+                "code": "400",
+                "status": "error",
+                "type": "message",
+                "value": "Invalid or missing end_date. Format should be YYYY-MM-DD"
+            }
+            return jsonify(error_data), 400
+        unknown = [name for name in metrics if name not in METRICS]
+        if not metrics or unknown:
+            error_data = {
+                "code": "400",
+                "status": "error",
+                "type": "message",
+                "value": "Invalid or missing metrics. Known metrics: " + ", ".join(sorted(METRICS))
+            }
+            return jsonify(error_data), 400
+
+        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
+        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+        if end_date_obj < start_date_obj:
+            error_data = {
+                "code": "400",
+                "status": "error",
+                "type": "message",
+                "value": "End date cannot be earlier than start date"
+            }
+            return jsonify(error_data), 400
+
+        metrics = list(dict.fromkeys(metrics))
+        query, tags = batch_query(metrics, start_date_obj, end_date_obj)
+        data = db.execute_query(query, heavy=db.is_heavy_range(start_date_obj, end_date_obj))
+
+        json_data = {}
+        for name in metrics:
+            _, keys, _, shape = METRICS[name]
+            rows = data[data['metric'] == tags[name]]
+            rows = rows[['key1', 'key2'][:len(keys)] + ['value']]
+            rows = rows.rename(columns=dict(zip(['key1', 'key2'], keys)))
+            if keys:
+                rows = rows.sort_values(keys)
+            json_data[name] = shape(rows.reset_index(drop=True))
+
+        response_data = {
+            "code": "200",
+            "hints": "",
+            "status": "success",
+            "type": "message",
+            "value": json_data
+        }
+
+        return jsonify(response_data)
+
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
+    except Exception as e:
+        error_data = {
+            "code": "500",
+            "hints": "Internal Server Error",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 500
@@ -1,6 +1,9 @@
 import pandas as pd
 from flask import Blueprint, jsonify, request
-from config import db
+from config import db, cache
+from config.database import QueryTimeout
+from config.query import rollup_query
+from config.streaming import streaming_requested, stream_records
 from datetime import datetime
 
 bp = Blueprint('faculty', __name__)
@@ -13,6 +16,7 @@ def validate_date(date_str):
         return False
 #ti le benh trong khoa
 @bp.route('/api/faculty/rate_of_patients_disease', methods=['GET'])
+@cache.cached
 def rate_of_patients_disease():
     try:
         start_date = request.headers.get('startdate')
@@ -46,18 +50,35 @@ def rate_of_patients_disease():
                 "value": "End date cannot be earlier than start date"
             }
             return jsonify(error_data), 400
-        query = f"""
-            SELECT Faculty, Diagnose, COUNT(*) as PatientCount FROM report.report
-            WHERE 
-            (year > {start_date_obj.year} OR (year = {start_date_obj.year} AND 
-            month > {start_date_obj.month}) OR (year = {start_date_obj.year} AND month = {start_date_obj.month} AND
-            day >= {start_date_obj.day}))
-            AND (year < {end_date_obj.year} OR (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-            (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-            GROUP BY Faculty, Diagnose
-        """
-
-        data = db.execute_query(query)
+
+        if streaming_requested():
+            # Faculty totals and rates come from a window over the summed rollup so rows
+            # can be streamed straight from the cursor
+            counts = rollup_query('report.rollup_faculty_diagnose', ['Faculty', 'Diagnose'],
+                                  {'PatientCount': 'patient_count'},
+                                  start_date_obj, end_date_obj, ordered=False)
+            query = f"""
+                SELECT Faculty, Diagnose, PatientCount,
+                    SUM(PatientCount) OVER (PARTITION BY Faculty) AS TotalPatients,
+                    PatientCount / SUM(PatientCount) OVER (PARTITION BY Faculty) AS DiseaseRate
+                FROM ({counts}) counts
+                ORDER BY Faculty, Diagnose
+            """
+            response = stream_records(db.stream_query(
+                query, columns=['Faculty', 'Diagnose', 'PatientCount', 'TotalPatients', 'DiseaseRate']))
+            if response is None:
+                error_data = {
+                    "code": "404",
+                    "status": "error",
+                    "type": "message",
+                    "value": "No data found for the given date range"
+                }
+                return jsonify(error_data), 404
+            return response
+
+        data = db.read_rollup('report.rollup_faculty_diagnose', ['Faculty', 'Diagnose'],
+                               {'PatientCount': 'patient_count'},
+                               start_date_obj, end_date_obj)
 
         if data.empty:
             error_data ={
@@ -85,6 +106,15 @@ def rate_of_patients_disease():
 
         return jsonify(response_data)
 
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         error_data = {
             "code": "500",
@@ -98,6 +128,7 @@ def rate_of_patients_disease():
 
 #tong ben nhan trong khoa
 @bp.route('/api/faculty/sum_patient_faculty', methods=['GET'])
+@cache.cached
 def sum_patient_faculty():
     try:
         start_date = request.headers.get('startdate')
@@ -132,19 +163,8 @@ def sum_patient_faculty():
             }
             return jsonify(error_data), 400
 
-        query = f"""
-            SELECT faculty FROM report.report
-            WHERE 
-            (year > {start_date_obj.year} OR 
-             (year = {start_date_obj.year} AND month > {start_date_obj.month}) OR 
-             (year = {start_date_obj.year} AND month = {start_date_obj.month} AND day >= {start_date_obj.day}))
-            AND 
-            (year < {end_date_obj.year} OR 
-             (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-             (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-        """
-
-        data = db.execute_query(query)
+        data = db.read_rollup('report.rollup_faculty_diagnose', ['faculty'], {'PatientCount': 'patient_count'},
+                               start_date_obj, end_date_obj)
 
         if data.empty:
             error_data = {
@@ -155,9 +175,7 @@ def sum_patient_faculty():
             }
             return jsonify(error_data), 404
 
-        grouped = data.groupby('faculty').size().reset_index(name='PatientCount')
-
-        json_data = grouped.to_dict(orient='records')
+        json_data = data.to_dict(orient='records')
 
         response_data = {
             "code": "200",
@@ -168,6 +186,15 @@ def sum_patient_faculty():
 
         return jsonify(response_data)
 
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         error_data = {
             "code": "500",
@@ -181,6 +208,7 @@ def sum_patient_faculty():
 
 #benh pho bien nhat
 @bp.route('/api/faculty/most_common_disease', methods=['GET'])
+@cache.cached
 def most_common_disease():
     try:
         start_date = request.headers.get('startdate')
@@ -215,19 +243,9 @@ def most_common_disease():
             }
             return jsonify(error_data), 400
 
-        query = f"""
-            SELECT Faculty, Diagnose, COUNT(*) as PatientCount 
-            FROM report.report
-            WHERE 
-            (year > {start_date_obj.year} OR (year = {start_date_obj.year} AND 
-            month > {start_date_obj.month}) OR (year = {start_date_obj.year} AND month = {start_date_obj.month} AND
-            day >= {start_date_obj.day}))
-            AND (year < {end_date_obj.year} OR (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-            (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-            GROUP BY Faculty, Diagnose
-        """
-
-        data = db.execute_query(query)
+        data = db.read_rollup('report.rollup_faculty_diagnose', ['Faculty', 'Diagnose'],
+                               {'PatientCount': 'patient_count'},
+                               start_date_obj, end_date_obj)
 
         if data.empty:
             error_data = {
@@ -261,6 +279,16 @@ def most_common_disease():
 
         return jsonify(error_data), 404
 
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
     # Handle other errors
         error_data = {
@@ -1,7 +1,8 @@
 import json
 from flask import Blueprint, jsonify, request
 import pandas as pd
-from config import db
+from config import db, cache
+from config.database import QueryTimeout
 from datetime import datetime
 
 bp = Blueprint('gender', __name__)
@@ -16,6 +17,7 @@ def validate_date(date_str):
 
 #so luong nam nu moi dich vu
 @bp.route('/api/gender/service_gender', methods=['GET'])
+@cache.cached
 def api_gender():
     try:
         start_date = request.headers.get('startdate')
@@ -50,19 +52,8 @@ def api_gender():
             }
             return jsonify(error_data), 400
 
-        query = f"""
-            SELECT Service, Gender FROM report.report
-            WHERE 
-            (year > {start_date_obj.year} OR 
-             (year = {start_date_obj.year} AND month > {start_date_obj.month}) OR 
-             (year = {start_date_obj.year} AND month = {start_date_obj.month} AND day >= {start_date_obj.day}))
-            AND 
-            (year < {end_date_obj.year} OR 
-             (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-             (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-        """
-
-        data = db.execute_query(query)
+        data = db.read_rollup('report.rollup_service', ['Service', 'Gender'], {'ServiceCount': 'service_count'},
+                               start_date_obj, end_date_obj)
 
         if data.empty:
             error_data = {
@@ -74,15 +65,9 @@ def api_gender():
             }
             return jsonify(error_data), 404
 
-        # Clean up and process data
-        data['Service'] = data['Service'].str.strip('[]').str.replace('\\"', '').str.split('\",\"')
-        data = data.explode('Service')
-        data['Service'] = data['Service'].str.replace('"', '')  # Remove double quotes
-
-        # Create pivot table to count male and female for each service.py
-
-        # Create pivot table to count male and female for each service.py
-        pivot_table = pd.pivot_table(data, index='Service', columns='Gender', aggfunc='size', fill_value=0)
+        # Pivot the per-(service, gender) counts so each service has one column per gender
+        pivot_table = pd.pivot_table(data, index='Service', columns='Gender', values='ServiceCount',
+                                     aggfunc='sum', fill_value=0)
 
         # Convert to dictionary format
         json_data = pivot_table.reset_index().to_dict(orient='records')
@@ -107,6 +92,16 @@ def api_gender():
         }
         return jsonify(error_data), 404
 
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         error_data = {
             "code": "500",
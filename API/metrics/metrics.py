@@ -0,0 +1,10 @@
+from flask import Blueprint, Response
+from config import metrics, cache
+
+bp = Blueprint('metrics', __name__)
+
+
+# Prometheus scrape endpoint
+@bp.route('/metrics', methods=['GET'])
+def export():
+    return Response(metrics.render(cache), mimetype='text/plain; version=0.0.4')
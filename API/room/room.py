@@ -1,7 +1,7 @@
 import json
 from flask import Blueprint, jsonify, request
-import pandas as pd
-from config import db
+from config import db, cache
+from config.database import QueryTimeout
 from datetime import datetime
 
 bp = Blueprint('room', __name__)
@@ -15,6 +15,7 @@ def validate_date(date_str):
         return False
 #so luong dich vu cua moi phong
 @bp.route('/api/room/sumserviceroom/', methods=['GET'])
+@cache.cached
 def sum_service_room():
     try:
         start_date = request.headers.get('startdate')
@@ -48,19 +49,8 @@ def sum_service_room():
             }
             return jsonify(error_data), 400
 
-        query = f"""
-            SELECT Service, room FROM report.report
-            WHERE 
-            (year > {start_date_obj.year} OR 
-             (year = {start_date_obj.year} AND month > {start_date_obj.month}) OR 
-             (year = {start_date_obj.year} AND month = {start_date_obj.month} AND day >= {start_date_obj.day}))
-            AND 
-            (year < {end_date_obj.year} OR 
-             (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-             (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-        """
-
-        data = db.execute_query(query)
+        data = db.read_rollup('report.rollup_service', ['room'], {'total_service': 'service_count'},
+                               start_date_obj, end_date_obj)
 
         if data.empty:
             error_data = {
@@ -72,12 +62,7 @@ def sum_service_room():
             }
             return jsonify(error_data), 404
 
-        # Clean up and process data
-        data['Service'] = data['Service'].str.strip('[]').str.replace('\\"', '').str.split('\",\"')
-        data = data.explode('Service')
-        data['Service'] = data['Service'].str.replace('"', '')  # Remove double quotes
-        pivot_table = pd.pivot_table(data, index='room', aggfunc='size')
-        json_data = pivot_table.reset_index(name='total_service').to_dict(orient='records')
+        json_data = data.to_dict(orient='records')
 
         response_data = {
             "code": "200",
@@ -99,6 +84,16 @@ def sum_service_room():
         }
         return jsonify(error_data), 404
 
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         error_data = {
             "code": "500",
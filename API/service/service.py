@@ -1,7 +1,7 @@
 import json
 from flask import Blueprint, jsonify, request
-import pandas as pd
-from config import db
+from config import db, cache
+from config.database import QueryTimeout
 from datetime import datetime
 
 bp = Blueprint('service', __name__)
@@ -14,6 +14,7 @@ def validate_date(date_str):
         return False
 
 @bp.route('/api/service/sumservice/', methods=['GET'])
+@cache.cached
 def sum_service():
     try:
         # Get JSON data from request
@@ -51,21 +52,8 @@ def sum_service():
             return jsonify(error_data), 400
         # Extract day, month, year from start_date and end_date
 
-        # Adjust query to include date filtering
-        query = f"""
-                       SELECT Service, Gender FROM report.report
-                       WHERE 
-                       (year > {start_date_obj.year} OR 
-                        (year = {start_date_obj.year} AND month > {start_date_obj.month}) OR 
-                        (year = {start_date_obj.year} AND month = {start_date_obj.month} AND day >= {start_date_obj.day}))
-                       AND 
-                       (year < {end_date_obj.year} OR 
-                        (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-                        (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-                   """
-
-        # Execute query and get data
-        data = db.execute_query(query)
+        data = db.read_rollup('report.rollup_service', ['Service'], {'total': 'service_count'},
+                               start_date_obj, end_date_obj)
 
         # Check if data is empty and return appropriate response
         if data.empty:
@@ -77,16 +65,8 @@ def sum_service():
             }
             return jsonify(error_data), 404
 
-        # Initialize counters
-        data['Service'] = data['Service'].str.strip('[]').str.replace('\\"', '').str.split('\",\"')
-        data = data.explode('Service')
-        data['Service'] = data['Service'].str.replace('"', '')  # Remove double quotes
-
-        # Create pivot table to count occurrences of each service
-        pivot_table = pd.pivot_table(data, index='Service', aggfunc='size')
-
         # Convert to dictionary format
-        json_data = pivot_table.reset_index(name='total').to_dict(orient='records')
+        json_data = data.to_dict(orient='records')
 
         response_data = {
             "code": "200",
@@ -107,6 +87,16 @@ def sum_service():
                 "value": str(e)
             }
             return jsonify(error_data), 404
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         # Handle other errors
         error_data = {
@@ -1,5 +1,8 @@
 from flask import Blueprint, jsonify, request
-from config import db
+from config import db, cache
+from config.database import QueryTimeout
+from config.query import rollup_query
+from config.streaming import streaming_requested, stream_records
 from datetime import datetime
 
 bp = Blueprint('sum', __name__)
@@ -13,36 +16,8 @@ def validate_date(date_str):
         return False
 
 
-def calculate_age(birth_date):
-    if birth_date is None:
-        return None
-    today = datetime.now()
-    age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-    if age < 200:
-        return age
-    return None
-
-
-def parse_birth_date(birth_date_str):
-    try:
-        birth_year = int(birth_date_str)
-        if birth_year < 200:
-            today = datetime.now()
-            birth_date = datetime(today.year - birth_year, today.month, today.day)
-        else:
-            birth_date = datetime(birth_year, 1, 1)
-    except ValueError:
-        formats = ['%d-%m-%Y', '%Y']
-        for fmt in formats:
-            try:
-                return datetime.strptime(birth_date_str, fmt)
-            except ValueError:
-                continue
-        return None
-    return birth_date
-
-
 @bp.route('/api/sum/old/', methods=['GET'])
+@cache.cached
 def api_old():
     try:
         # Get JSON data from request
@@ -78,23 +53,10 @@ def api_old():
                 "value": "End date cannot be earlier than start date"
             }
             return jsonify(error_data), 400
-        # Extract day, month, year from start_date and end_date
-        start_day, start_month, start_year = start_date_obj.day, start_date_obj.month, start_date_obj.year
-        end_day, end_month, end_year = end_date_obj.day, end_date_obj.month, end_date_obj.year
-
-        # Adjust query to include date filtering
-        query = f"""
-            SELECT ID Patient,BirthDate,Diagnose  FROM report.report
-            WHERE 
-            (year > {start_year} OR (year = {start_year} AND 
-            month > {start_month}) OR (year = {start_year} AND month = {start_month} AND
-            day >= {start_day}))
-            AND (year < {end_year} OR (year = {end_year} AND month < {end_month}) OR 
-            (year = {end_year} AND month = {end_month} AND day <= {end_day}))
-        """
-
-        # Execute query and get data
-        data = db.execute_query(query)
+
+        # Age groups are materialized by the ETL and summed from the daily age rollup
+        data = db.read_rollup('report.rollup_age', ['age_bucket'], {'patient_count': 'patient_count'},
+                               start_date_obj, end_date_obj)
 
         # Check if data is empty and return appropriate response
         if data.empty:
@@ -106,32 +68,12 @@ def api_old():
             }
             return jsonify(error_data), 404
 
-        # Initialize counters
-        children_count = 0
-        adults_count = 0
-        elders_count = 0
-
-        # Process and return data with age calculation
-        for idx, row in data.iterrows():
-            birth_date_str = row["BirthDate"]
-            birth_date = parse_birth_date(birth_date_str)
-            age = calculate_age(birth_date)
-
-            if age is not None:
-                if age < 18:
-                    children_count += 1
-                elif age >= 18 and age < 60:
-                    adults_count += 1
-                elif age >= 60:
-                    elders_count += 1
-
-            data.at[idx, "Age"] = age
-
-        # Create response dictionary
+        # Count patients per age group
+        counts = dict(zip(data['age_bucket'].astype(str), data['patient_count']))
         data_count = {
-            "children_count": children_count,
-            "adults_count": adults_count,
-            "elders_count": elders_count
+            "children_count": int(counts.get('children', 0)),
+            "adults_count": int(counts.get('adults', 0)),
+            "elders_count": int(counts.get('elders', 0))
         }
         response_data = {
             "code": "200",
@@ -151,6 +93,16 @@ def api_old():
             "value": str(e)
         }
         return jsonify(error_data), 404
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         # Handle other errors
         error_data = {
@@ -164,6 +116,7 @@ def api_old():
 
 
 @bp.route('/api/sum/sum_patient_doctor', methods=['GET'])
+@cache.cached
 def sum_patient_doctor():
     try:
         start_date = request.headers.get('startdate')
@@ -198,19 +151,23 @@ def sum_patient_doctor():
             }
             return jsonify(error_data), 400
 
-        query = f"""
-            SELECT DoctorName FROM report.report
-            WHERE 
-            (year > {start_date_obj.year} OR 
-             (year = {start_date_obj.year} AND month > {start_date_obj.month}) OR 
-             (year = {start_date_obj.year} AND month = {start_date_obj.month} AND day >= {start_date_obj.day}))
-            AND 
-            (year < {end_date_obj.year} OR 
-             (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-             (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-        """
-
-        data = db.execute_query(query)
+        if streaming_requested():
+            query = rollup_query('report.rollup_doctor', ['DoctorName'], {'PatientCount': 'patient_count'},
+                                 start_date_obj, end_date_obj)
+            response = stream_records(db.stream_query(query, columns=['DoctorName', 'PatientCount']), hints="")
+            if response is None:
+                error_data = {
+                    "code": "404",
+                    "hints": "",
+                    "status": "error",
+                    "type": "message",
+                    "value": "No data found for the given date range"
+                }
+                return jsonify(error_data), 404
+            return response
+
+        data = db.read_rollup('report.rollup_doctor', ['DoctorName'], {'PatientCount': 'patient_count'},
+                               start_date_obj, end_date_obj)
 
         if data.empty:
             error_data = {
@@ -221,9 +178,7 @@ def sum_patient_doctor():
                 "value": "No data found for the given date range"
             }
             return jsonify(error_data), 404
-        grouped = data.groupby('DoctorName').size().reset_index(name='PatientCount')
-        # Clean up and process data
-        json_data=grouped.to_dict(orient='records')
+        json_data = data.to_dict(orient='records')
 
         response_data = {
             "code": "200",
@@ -245,6 +200,16 @@ def sum_patient_doctor():
         }
         return jsonify(error_data), 404
 
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         error_data = {
             "code": "500",
@@ -259,6 +224,7 @@ def sum_patient_doctor():
 
 #tong benh nhan
 @bp.route('/api/sum/sumpatient', methods=['GET'])
+@cache.cached
 def api_sum_patient():
     try:
 
@@ -292,17 +258,8 @@ def api_sum_patient():
             }
             return jsonify(error_data), 400
 
-        query = f"""
-            SELECT COUNT(*) as total_patients FROM report.report
-            WHERE 
-            (year > {start_date_obj.year} OR (year = {start_date_obj.year} AND 
-            month > {start_date_obj.month}) OR (year = {start_date_obj.year} AND month = {start_date_obj.month} AND
-            day >= {start_date_obj.day}))
-            AND (year < {end_date_obj.year} OR (year = {end_date_obj.year} AND month < {end_date_obj.month}) OR 
-            (year = {end_date_obj.year} AND month = {end_date_obj.month} AND day <= {end_date_obj.day}))
-        """
-
-        result = db.execute_query(query)
+        result = db.read_rollup('report.rollup_patients', [], {'total_patients': 'patient_count'},
+                               start_date_obj, end_date_obj)
         if result.empty:
             error_data = {
                 "code": "404",
@@ -335,6 +292,16 @@ def api_sum_patient():
         }
         return jsonify(error_data), 404
 
+    except QueryTimeout as e:
+        error_data = {
+            "code": "504",
+            "hints": "Query Timeout",
+            "status": "error",
+            "type": "message",
+            "value": str(e)
+        }
+        return jsonify(error_data), 504
+
     except Exception as e:
         # Xử lý các lỗi khác
         error_data = {
@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+from flask import Flask, jsonify, request
+
+from config.cache import ResultCache
+
+
+def key(endpoint, start, end):
+    return ResultCache.range_key(endpoint, start.isoformat(), end.isoformat())
+
+
+def test_live_ranges_expire_and_final_ranges_stay():
+    cache = ResultCache(live_ttl=0, live_days=2)
+    today = date.today()
+    live = key('sum', today - timedelta(days=7), today - timedelta(days=1))
+    final = key('sum', today - timedelta(days=7), today - timedelta(days=2))
+    cache.put(live, b'live', 200, 'application/json')
+    cache.put(final, b'final', 200, 'application/json')
+    assert cache.get(live) is None
+    assert cache.get(final)[0] == b'final'
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(max_entries=2)
+    first, second, third = (key('sum', date(2024, 1, day), date(2024, 1, day)) for day in (1, 2, 3))
+    cache.put(first, b'1', 200, 'application/json')
+    cache.put(second, b'2', 200, 'application/json')
+    cache.get(first)
+    cache.put(third, b'3', 200, 'application/json')
+    assert cache.get(second) is None
+    assert cache.get(first)[0] == b'1'
+    assert cache.get(third)[0] == b'3'
+
+
+def test_entries_are_evicted_by_size():
+    cache = ResultCache(max_bytes=10)
+    first, second = (key('sum', date(2024, 1, day), date(2024, 1, day)) for day in (1, 2))
+    cache.put(first, b'x' * 6, 200, 'application/json')
+    cache.put(second, b'y' * 6, 200, 'application/json')
+    assert cache.get(first) is None
+    assert cache.stats()['bytes'] == 6
+    cache.put(first, b'z' * 11, 200, 'application/json')
+    assert cache.get(first) is None
+
+
+def test_cached_view_serves_repeated_ranges():
+    cache = ResultCache()
+    calls = []
+    app = Flask(__name__)
+
+    @app.route('/total')
+    @cache.cached(vary=('metrics',))
+    def total():
+        calls.append(request.headers.get('metrics'))
+        if request.headers.get('metrics') == 'bad':
+            return jsonify({"code": "400"}), 400
+        return jsonify({"code": "200", "value": len(calls)})
+
+    client = app.test_client()
+    headers = {'startdate': '2024-01-01', 'enddate': '2024-01-31', 'metrics': 'a'}
+    assert client.get('/total', headers=headers).json['value'] == 1
+    assert client.get('/total', headers=headers).json['value'] == 1
+    assert client.get('/total', headers=dict(headers, metrics='b')).json['value'] == 2
+    client.get('/total', headers=dict(headers, metrics='bad'))
+    client.get('/total', headers=dict(headers, metrics='bad'))
+    assert calls == ['a', 'b', 'bad', 'bad']
@@ -0,0 +1,85 @@
+import pytest
+
+pytest.importorskip('duckdb')
+
+import config
+import dashboard.dashboard
+import faculty.faculty
+import gender.gender
+import room.room
+import service.service
+import sum.sum
+from config.database import Database, DuckDBBackend
+
+ENDPOINTS = {
+    'sumpatient': '/api/sum/sumpatient',
+    'sum_patient_doctor': '/api/sum/sum_patient_doctor',
+    'sum_patient_faculty': '/api/faculty/sum_patient_faculty',
+    'rate_of_patients_disease': '/api/faculty/rate_of_patients_disease',
+    'most_common_disease': '/api/faculty/most_common_disease',
+    'sumserviceroom': '/api/room/sumserviceroom/',
+    'sumservice': '/api/service/sumservice/',
+    'service_gender': '/api/gender/service_gender',
+}
+
+ROWS = {
+    'report.rollup_patients': [(5, '01'), (7, '02')],
+    'report.rollup_doctor': [('Bob', 2, '01'), ('Ann', 3, '01'), ('Bob', 7, '02')],
+    'report.rollup_faculty_diagnose': [('Surgery', 'Fracture', 3, '01'), ('Surgery', 'Burn', 1, '01'),
+                                       ('Internal', 'Flu', 4, '02'), ('Surgery', 'Fracture', 4, '02')],
+    'report.rollup_service': [('A1', 'Xray', 'M', 2, '01'), ('A1', 'Xray', 'F', 1, '01'),
+                              ('B2', 'Lab', 'F', 5, '02')],
+}
+
+COLUMNS = {
+    'report.rollup_patients': "patient_count BIGINT",
+    'report.rollup_doctor': "DoctorName VARCHAR, patient_count BIGINT",
+    'report.rollup_faculty_diagnose': "Faculty VARCHAR, Diagnose VARCHAR, patient_count BIGINT",
+    'report.rollup_service': "Room VARCHAR, Service VARCHAR, Gender VARCHAR, service_count BIGINT",
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = Database(host=None, port=None, backend=DuckDBBackend(), partials_max_bytes=0)
+    con = db.backend.database
+    con.execute("CREATE SCHEMA report")
+    for table, rows in ROWS.items():
+        con.execute(f"CREATE TABLE {table} ({COLUMNS[table]}, year VARCHAR, month VARCHAR, day VARCHAR)")
+        for *row, day in rows:
+            con.execute(f"INSERT INTO {table} VALUES ({', '.join('?' * (len(row) + 3))})",
+                        [*row, '2024', '01', day])
+    for module in (dashboard.dashboard, faculty.faculty, gender.gender, room.room, service.service, sum.sum):
+        monkeypatch.setattr(module, 'db', db)
+    config.cache.clear()
+    yield config.create_app().test_client()
+    config.cache.clear()
+    db.close()
+
+
+def test_batch_values_match_the_single_endpoints(client):
+    headers = {'startdate': '2024-01-01', 'enddate': '2024-01-02'}
+    response = client.get('/api/dashboard/batch', headers=dict(headers, metrics=','.join(ENDPOINTS)))
+    assert response.status_code == 200
+    for name, endpoint in ENDPOINTS.items():
+        assert response.json['value'][name] == client.get(endpoint, headers=headers).json['value'], name
+
+
+def test_batch_shapes(client):
+    response = client.get('/api/dashboard/batch', headers={
+        'startdate': '2024-01-01', 'enddate': '2024-01-02',
+        'metrics': 'sumpatient, sum_patient_doctor, service_gender, most_common_disease'})
+    assert response.json['value'] == {
+        'sumpatient': {'total_patients': 12},
+        'sum_patient_doctor': [{'DoctorName': 'Ann', 'PatientCount': 3}, {'DoctorName': 'Bob', 'PatientCount': 9}],
+        'service_gender': [{'Service': 'Lab', 'F': 5, 'M': 0}, {'Service': 'Xray', 'F': 1, 'M': 2}],
+        'most_common_disease': [{'Faculty': 'Internal', 'Diagnose': 'Flu', 'PatientCount': 4},
+                                {'Faculty': 'Surgery', 'Diagnose': 'Fracture', 'PatientCount': 7}],
+    }
+
+
+def test_batch_rejects_unknown_metrics(client):
+    response = client.get('/api/dashboard/batch', headers={
+        'startdate': '2024-01-01', 'enddate': '2024-01-02', 'metrics': 'sumpatient,nope'})
+    assert response.status_code == 400
+    assert response.json['value'].startswith("Invalid or missing metrics")
@@ -0,0 +1,117 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from config.database import Database, QueryTimeout
+
+
+class Backend:
+    # Counts executions; each query waits until released
+    name = 'fake'
+
+    def __init__(self, error=None):
+        self.error = error
+        self.executed = []
+        self.release = threading.Event()
+        self.cancelled = threading.Event()
+
+    def connect(self):
+        return self
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def execute(self, cursor, query, cancelled, deadline=None):
+        self.executed.append(query)
+        while not self.release.wait(0.01):
+            if cancelled.is_set():
+                self.cancelled.set()
+                raise RuntimeError("cancelled")
+        if self.error is not None:
+            raise self.error
+
+    def fetch_frame(self, cursor):
+        return pd.DataFrame({'value': [1, 2]})
+
+
+def database(backend):
+    return Database(host=None, port=None, backend=backend, partials_max_bytes=0)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_identical_queries_share_one_execution():
+    backend = Backend()
+    db = database(backend)
+    with ThreadPoolExecutor(max_workers=5) as callers:
+        futures = [callers.submit(db.execute_query, 'SELECT 1') for _ in range(5)]
+        wait_for(lambda: len(backend.executed) == 1 and db._flights and
+                 next(iter(db._flights.values())).waiters == 5)
+        backend.release.set()
+        frames = [future.result(5) for future in futures]
+    assert backend.executed == ['SELECT 1']
+    assert all(frame['value'].tolist() == [1, 2] for frame in frames)
+    # Each caller gets its own copy to post-process
+    frames[0].loc[0, 'value'] = 100
+    assert frames[1].loc[0, 'value'] == 1
+    db.close()
+
+
+def test_different_queries_run_separately():
+    backend = Backend()
+    backend.release.set()
+    db = database(backend)
+    db.execute_query('SELECT 1')
+    db.execute_query('SELECT 2')
+    db.execute_query('SELECT 1')
+    assert backend.executed == ['SELECT 1', 'SELECT 2', 'SELECT 1']
+    db.close()
+
+
+def test_errors_reach_every_caller():
+    backend = Backend(error=ValueError("bad query"))
+    db = database(backend)
+    with ThreadPoolExecutor(max_workers=3) as callers:
+        futures = [callers.submit(db.execute_query, 'SELECT 1') for _ in range(3)]
+        wait_for(lambda: db._flights and next(iter(db._flights.values())).waiters == 3)
+        backend.release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(5)
+    assert len(backend.executed) == 1
+    assert not db._flights
+    db.close()
+
+
+def test_last_waiter_timing_out_cancels_the_query():
+    backend = Backend()
+    db = database(backend)
+    with pytest.raises(QueryTimeout):
+        db.execute_query('SELECT 1', timeout=0.05)
+    assert backend.cancelled.wait(5)
+    assert not db._flights
+    db.close()
+
+
+def test_query_survives_while_another_caller_waits():
+    backend = Backend()
+    db = database(backend)
+    with ThreadPoolExecutor(max_workers=1) as callers:
+        patient = callers.submit(db.execute_query, 'SELECT 1', 5)
+        wait_for(lambda: len(backend.executed) == 1)
+        with pytest.raises(QueryTimeout):
+            db.execute_query('SELECT 1', timeout=0.05)
+        backend.release.set()
+        assert patient.result(5)['value'].tolist() == [1, 2]
+    assert not backend.cancelled.is_set()
+    db.close()
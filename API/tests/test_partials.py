@@ -0,0 +1,95 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip('duckdb')
+
+from config.database import Database, DuckDBBackend
+from config.query import rollup_query
+
+START = date(2024, 1, 1)
+
+
+class LowercaseBackend(DuckDBBackend):
+    # Hive answers with lowercased column names
+    def fetch_frame(self, cursor):
+        frame = super().fetch_frame(cursor)
+        frame.columns = [column.lower() for column in frame.columns]
+        return frame
+
+
+def load(db, days):
+    con = db.backend.database
+    con.execute("CREATE SCHEMA IF NOT EXISTS report")
+    con.execute("CREATE TABLE report.rollup_doctor (DoctorName VARCHAR, patient_count BIGINT, "
+                "year VARCHAR, month VARCHAR, day VARCHAR)")
+    for offset in range(days):
+        day = START + timedelta(days=offset)
+        # Later names appear first, so dictionary order differs from value order
+        for index, name in enumerate(['Zed', 'Ann', 'Bob'][offset % 3:] + ['Zed', 'Ann', 'Bob'][:offset % 3]):
+            con.execute("INSERT INTO report.rollup_doctor VALUES (?, ?, ?, ?, ?)",
+                        [name, offset + index + 1, day.strftime('%Y'), day.strftime('%m'), day.strftime('%d')])
+
+
+@pytest.fixture(params=[DuckDBBackend, LowercaseBackend])
+def db(request):
+    db = Database(host=None, port=None, backend=request.param())
+    load(db, 40)
+    yield db
+    db.close()
+
+
+def direct(db, keys, measures, start, end):
+    return db.execute_query(rollup_query('report.rollup_doctor', keys, measures, start, end))
+
+
+def records(frame):
+    return [tuple(row) for row in frame.astype(object).itertuples(index=False)]
+
+
+def test_read_matches_direct_query(db):
+    measures = {'PatientCount': 'patient_count'}
+    for start, end in [(START, START + timedelta(days=29)), (START + timedelta(days=5), START + timedelta(days=5))]:
+        data = db.read_rollup('report.rollup_doctor', ['DoctorName'], measures, start, end)
+        assert list(data.columns) == ['DoctorName', 'PatientCount']
+        assert records(data) == records(direct(db, ['DoctorName'], measures, start, end))
+
+
+def test_read_merges_cached_and_fetched_days(db):
+    queries = []
+    execute_query = db.execute_query
+
+    def spy(query, **kwargs):
+        queries.append(query)
+        return execute_query(query, **kwargs)
+    db.execute_query = spy
+
+    measures = {'PatientCount': 'patient_count'}
+    db.read_rollup('report.rollup_doctor', ['DoctorName'], measures, START, START + timedelta(days=29))
+    queries.clear()
+    data = db.read_rollup('report.rollup_doctor', ['DoctorName'], measures,
+                          START + timedelta(days=1), START + timedelta(days=30))
+    assert len(queries) == 1
+    assert "day IN ('31')" in queries[0]
+    db.execute_query = execute_query
+    assert records(data) == records(direct(db, ['DoctorName'], measures,
+                                           START + timedelta(days=1), START + timedelta(days=30)))
+
+
+def test_read_without_keys_sums_every_day(db):
+    data = db.read_rollup('report.rollup_doctor', [], {'total': 'patient_count'}, START, START + timedelta(days=2))
+    assert data.to_dict(orient='records') == [{'total': 6 + 9 + 12}]
+
+
+def test_empty_days_answer_empty(db):
+    data = db.read_rollup('report.rollup_doctor', ['DoctorName'], {'PatientCount': 'patient_count'},
+                          date(2023, 1, 1), date(2023, 1, 5))
+    assert data.empty
+
+
+def test_live_days_are_not_kept(db):
+    today = date.today()
+    db.read_rollup('report.rollup_doctor', ['DoctorName'], {'PatientCount': 'patient_count'},
+                   today - timedelta(days=3), today)
+    kept = {key[-1] for key in db.partials._entries}
+    assert kept == {today - timedelta(days=3), today - timedelta(days=2)}
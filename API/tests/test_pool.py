@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from config.database import ConnectionPool, PoolTimeout
+
+
+class Connection:
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def execute(self, query):
+                if not connection.healthy:
+                    raise RuntimeError("connection lost")
+
+            def fetchall(self):
+                return [(1,)]
+
+            def close(self):
+                pass
+        return Cursor()
+
+    def close(self):
+        self.closed = True
+
+
+def test_reuses_released_connections():
+    created = []
+    pool = ConnectionPool(lambda: created.append(Connection()) or created[-1], max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(created) == 1
+    assert pool.size == 1 and pool.idle == 1
+
+
+def test_checkout_times_out_when_exhausted():
+    pool = ConnectionPool(Connection, max_size=1)
+    item = pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.05)
+    pool.release(item)
+    pool.release(pool.acquire(timeout=0.05))
+
+
+def test_waiter_gets_released_connection():
+    pool = ConnectionPool(Connection, max_size=1)
+    item = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire(timeout=5)))
+    waiter.start()
+    pool.release(item)
+    waiter.join(5)
+    assert acquired and acquired[0] is item
+
+
+def test_broken_connections_are_closed_and_replaced():
+    pool = ConnectionPool(Connection, max_size=1)
+    item = pool.acquire()
+    pool.release(item, broken=True)
+    assert item.conn.closed
+    assert pool.size == 0
+    assert pool.acquire().conn is not item.conn
+
+
+def test_failed_checkout_is_health_checked_before_reuse():
+    pool = ConnectionPool(Connection, max_size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.healthy = False
+            raise RuntimeError("query failed")
+    with pool.connection() as replacement:
+        assert replacement is not conn
+    assert conn.closed
+
+
+def test_factory_failure_frees_the_slot():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("refused")
+        return Connection()
+    pool = ConnectionPool(factory, max_size=1)
+    with pytest.raises(OSError):
+        pool.acquire()
+    assert pool.size == 0
+    pool.acquire(timeout=0.05)
+
+
+def test_rejects_invalid_sizes():
+    with pytest.raises(ValueError):
+        ConnectionPool(Connection, min_size=3, max_size=2)
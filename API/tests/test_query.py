@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+
+from config.query import days_filter, partition_filter
+
+
+def test_partition_filter_collapses_full_years_and_months():
+    assert partition_filter(date(2023, 1, 1), date(2023, 12, 31)) == "(year = '2023')"
+    assert partition_filter(date(2024, 2, 1), date(2024, 3, 31)) == "((year = '2024' AND month IN ('02', '03')))"
+
+
+def test_partition_filter_lists_partial_months_by_day():
+    assert partition_filter(date(2024, 1, 30), date(2024, 3, 2)) == (
+        "((year = '2024' AND month = '01' AND day IN ('30', '31')) OR "
+        "(year = '2024' AND month = '03' AND day IN ('01', '02')) OR "
+        "(year = '2024' AND month IN ('02')))")
+
+
+def test_partition_filter_spans_years():
+    assert partition_filter(date(2023, 12, 31), date(2025, 1, 1)) == (
+        "((year = '2023' AND month = '12' AND day IN ('31')) OR year = '2024' OR "
+        "(year = '2025' AND month = '01' AND day IN ('01')))")
+
+
+def test_partition_filter_handles_leap_day():
+    assert partition_filter(date(2024, 2, 1), date(2024, 2, 29)) == "((year = '2024' AND month IN ('02')))"
+    assert "'29'" in partition_filter(date(2024, 2, 28), date(2024, 2, 29))
+
+
+def test_partition_filter_rejects_reversed_range():
+    with pytest.raises(ValueError):
+        partition_filter(date(2024, 1, 2), date(2024, 1, 1))
+
+
+def test_days_filter_collapses_consecutive_runs():
+    days = [date(2024, 1, 3), date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 10)]
+    assert days_filter(days) == ("(" + partition_filter(date(2024, 1, 1), date(2024, 1, 3)) + " OR "
+                                 + partition_filter(date(2024, 1, 10), date(2024, 1, 10)) + ")")
+
+
+def test_days_filter_runs_across_month_end():
+    assert days_filter([date(2024, 1, 31), date(2024, 2, 1)]) == \
+        "(" + partition_filter(date(2024, 1, 31), date(2024, 2, 1)) + ")"
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip('duckdb')
+pytest.importorskip('pyarrow')
+
+from config.database import Database, DuckDBBackend
+from config.query import days_filter
+from config.snapshot import SnapshotStore
+
+START = date(2024, 1, 1)
+END = date(2024, 1, 10)
+
+
+@pytest.fixture
+def db():
+    db = Database(host=None, port=None, backend=DuckDBBackend(), partials_max_bytes=0)
+    con = db.backend.database
+    con.execute("CREATE SCHEMA report")
+    con.execute("CREATE TABLE report.rollup_doctor (DoctorName VARCHAR, patient_count BIGINT, "
+                "year VARCHAR, month VARCHAR, day VARCHAR)")
+    for offset in range(12):
+        day = START + timedelta(days=offset)
+        if day == date(2024, 1, 5):
+            # A day without visits
+            continue
+        for index, name in enumerate(['Zed', 'Ann', 'Bob'][:offset % 3 + 1]):
+            con.execute("INSERT INTO report.rollup_doctor VALUES (?, ?, ?, ?, ?)",
+                        [name, offset + index + 1, day.strftime('%Y'), day.strftime('%m'), day.strftime('%d')])
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def store(tmp_path, db):
+    store = SnapshotStore(str(tmp_path), tables={'report.rollup_doctor': ['DoctorName', 'patient_count']},
+                          live_days=2)
+    store.window = lambda: (START, END)
+    store.refresh(db)
+    return store
+
+
+def test_covers_only_stored_days_inside_the_window(store):
+    assert store.covers('report.rollup_doctor', START, END)
+    assert store.covers('report.rollup_doctor', date(2024, 1, 5), date(2024, 1, 5))
+    assert not store.covers('report.rollup_doctor', START, END + timedelta(days=1))
+    assert not store.covers('report.rollup_doctor', START - timedelta(days=1), END)
+    assert not store.covers('report.rollup_patients', START, END)
+
+
+def test_read_matches_the_database(store, db):
+    measures = {'PatientCount': 'patient_count'}
+    for start, end in [(START, END), (date(2024, 1, 4), date(2024, 1, 6)), (date(2024, 1, 5), date(2024, 1, 5))]:
+        data = store.read('report.rollup_doctor', ['DoctorName'], measures, start, end)
+        expected = db.read_rollup('report.rollup_doctor', ['DoctorName'], measures, start, end)
+        assert data.astype(object).values.tolist() == expected.astype(object).values.tolist()
+
+
+def test_refresh_fetches_only_live_days(store, db):
+    queries = []
+    execute_query = db.execute_query
+
+    def spy(query, **kwargs):
+        queries.append(query)
+        return execute_query(query, **kwargs)
+    db.execute_query = spy
+
+    store.refresh(db)
+    assert len(queries) == 1
+    assert queries[0].endswith(days_filter([END - timedelta(days=1), END]))
+
+
+def test_clear_drops_every_day(store):
+    store.clear()
+    assert not store.covers('report.rollup_doctor', START, START)
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+pytest.importorskip('duckdb')
+
+import config
+import sum.sum
+from config.database import Database, DuckDBBackend
+from config.streaming import stream_records
+
+
+@pytest.fixture
+def client(monkeypatch):
+    db = Database(host=None, port=None, backend=DuckDBBackend(), partials_max_bytes=0)
+    con = db.backend.database
+    con.execute("CREATE SCHEMA report")
+    con.execute("CREATE TABLE report.rollup_doctor (DoctorName VARCHAR, patient_count BIGINT, "
+                "year VARCHAR, month VARCHAR, day VARCHAR)")
+    con.execute("INSERT INTO report.rollup_doctor VALUES ('Bob', 2, '2024', '01', '01'), "
+                "('Ann', 3, '2024', '01', '01'), ('Bob', 4, '2024', '01', '02')")
+    monkeypatch.setattr(sum.sum, 'db', db)
+    config.cache.clear()
+    yield config.create_app().test_client()
+    config.cache.clear()
+    db.close()
+
+
+def test_stream_records_wraps_chunks_in_the_envelope():
+    app = config.create_app()
+    with app.app_context():
+        response = stream_records(({'n': n} for n in range(5)), chunk_size=2, hints="")
+        chunks = list(response.response)
+    assert len(chunks) == 4
+    assert json.loads(''.join(chunks)) == {"code": "200", "status": "success", "type": "message", "hints": "",
+                                          "value": [{'n': n} for n in range(5)]}
+
+
+def test_streamed_response_matches_buffered_one(client):
+    headers = {'startdate': '2024-01-01', 'enddate': '2024-01-31'}
+    streamed = client.get('/api/sum/sum_patient_doctor', headers=dict(headers, stream='true'))
+    buffered = client.get('/api/sum/sum_patient_doctor', headers=headers)
+    assert streamed.status_code == buffered.status_code == 200
+    assert streamed.is_streamed
+    assert json.loads(streamed.get_data()) == buffered.json
+    assert buffered.json['value'] == [{'DoctorName': 'Ann', 'PatientCount': 3},
+                                      {'DoctorName': 'Bob', 'PatientCount': 6}]
+
+
+def test_streaming_an_empty_range_answers_404(client):
+    response = client.get('/api/sum/sum_patient_doctor',
+                          headers={'startdate': '2023-01-01', 'enddate': '2023-01-31', 'stream': 'true'})
+    assert response.status_code == 404
+    assert response.json['value'] == "No data found for the given date range"
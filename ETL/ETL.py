@@ -1,38 +1,207 @@
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, explode, expr, lit
+from pyspark.sql.functions import coalesce, col, concat_ws, count, current_timestamp, date_format, explode, \
+    expr, lit, sum as sum_, to_timestamp, window
+from pyspark.sql.types import StructType
+from pyspark.sql.utils import AnalysisException
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import argparse
 import datetime
+import json
+import os
+import threading
+import urllib.request
 
-if __name__ == "__main__":
-    # Get the current date
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+SOURCE_PATH = "hdfs://hadoop-namenode:8020/data/*"
+CHECKPOINT_LOCATION = "/home/hadoop/checkpointLocation/"
+# Kept beside the checkpoint rather than inside it so Spark never sees a foreign file there
+SCHEMA_LOCATION = "/home/hadoop/checkpointSchema/"
 
-    # Split year, month, and day from current_date
-    run_time = current_date.split("-")
-    year = run_time[0]
-    month = run_time[1]
-    day = run_time[2]
+PARTITION_COLUMNS = ["year", "month", "day"]
+
+# Visits that arrive too late for their day to still be live in the API's caches
+LATE_TABLE = "report.report5_late"
+
+# Where the visit time can live in a bundle entry, most specific first: the encounter
+# period, then when the service was requested, then when the resource was last updated
+EVENT_TIME_CANDIDATES = [
+    "filter(entry.resource.period.start, x -> x is not null)[0]",
+    "filter(entry.resource.authoredOn, x -> x is not null)[0]",
+    "filter(entry.resource.meta.lastUpdated, x -> x is not null)[0]",
+]
+
+# A re-delivered bundle repeats the same transaction: bundle id, patient and medical record
+DEDUP_KEYS = ["id", "IDPatient", "Medical Records"]
+
+# FHIR names arrive serialized; parse them once into typed structs
+NAME_SCHEMA = "array<struct<text:string>>"
+
+# Normalize the free-form BirthDate into a date: integers below 200 are ages at the
+# visit, other integers are birth years, anything else is a d-M-yyyy date.
+BIRTH_DATE = """
+    CASE
+        WHEN trim(BirthDate) RLIKE '^[+-]?[0-9]+$' AND CAST(trim(BirthDate) AS INT) < 200
+            THEN add_months(to_date(concat_ws('-', year, month, day)), -12 * CAST(trim(BirthDate) AS INT))
+        WHEN trim(BirthDate) RLIKE '^[+-]?[0-9]+$'
+            THEN make_date(CAST(trim(BirthDate) AS INT), 1, 1)
+        ELSE to_date(trim(BirthDate), 'd-M-yyyy')
+    END
+"""
+
+# Age on the visit date, materialized once so the API never parses BirthDate;
+# ages of 200 or more are treated as unknown
+_AGE_DIFF = "CAST(year AS INT) - year(BirthDate) - IF(date_format(BirthDate, 'MMdd') > concat(month, day), 1, 0)"
+AGE_AT_VISIT = f"IF({_AGE_DIFF} < 200, {_AGE_DIFF}, NULL)"
+
+# Same thresholds as the /api/sum/old/ age groups
+AGE_BUCKET = """
+    CASE
+        WHEN age_at_visit IS NULL THEN NULL
+        WHEN age_at_visit < 18 THEN 'children'
+        WHEN age_at_visit < 60 THEN 'adults'
+        ELSE 'elders'
+    END
+"""
+
+
+# Tables created by these writes are compressed ORC; existing tables keep the
+# storage format they were created with. Rows are shuffled by partition first so a
+# micro-batch adds one file per day partition (split at maxRecordsPerFile) instead
+# of one per shuffle task.
+def append_partitioned(df, table):
+    df.repartition(*PARTITION_COLUMNS).write.format("hive") \
+        .option("fileFormat", "orc") \
+        .option("orc.compress", "SNAPPY") \
+        .mode("append") \
+        .partitionBy(*PARTITION_COLUMNS) \
+        .saveAsTable(table)
+
+
+# saveAsTable appends by column name, but fails when the table has fewer columns
+# than df. Columns the ETL has gained since the table was created (EventTime,
+# age_at_visit, age_bucket) are added to it before the first write.
+def add_missing_columns(spark, table, schema):
+    if not spark.catalog.tableExists(table):
+        return
+    existing = {column.lower() for column in spark.table(table).columns}
+    missing = [field for field in schema.fields if field.name.lower() not in existing]
+    if missing:
+        columns = ", ".join(f"`{field.name}` {field.dataType.simpleString()}" for field in missing)
+        spark.sql(f"ALTER TABLE {table} ADD COLUMNS ({columns})")
+        print(f"Added columns to {table}: {columns}")
+
+
+# Replaces only the day partitions present in df, so rerunning a backfill chunk
+# leaves the table as a single run would
+def overwrite_partitioned(df, table):
+    spark = df.sparkSession
+    if not spark.catalog.tableExists(table):
+        append_partitioned(df, table)
+        return
+    df.repartition(*PARTITION_COLUMNS) \
+        .select(*spark.table(table).columns) \
+        .write.insertInto(table, overwrite=True)
+
+
+# Parquet copy of a table for the API's embedded DuckDB backend, laid out as
+# <directory>/<table>/year=/month=/day=; "overwrite" only replaces the days in df
+def export_parquet(df, table, directory, mode="append"):
+    df.repartition(*PARTITION_COLUMNS).write \
+        .mode(mode) \
+        .partitionBy(*PARTITION_COLUMNS) \
+        .parquet(f"{directory}/{table}")
+
+
+# Daily rollups: every micro-batch appends its partial counts, and the API sums
+# them over the requested days, so appending per batch stays additive.
+def write_rollups(batch_df, write=append_partitioned):
+    write(
+        batch_df.groupBy(*PARTITION_COLUMNS).agg(count(lit(1)).alias("patient_count")),
+        "report.rollup_patients")
+
+    write(
+        batch_df.groupBy(*PARTITION_COLUMNS, "DoctorName").agg(count(lit(1)).alias("patient_count")),
+        "report.rollup_doctor")
+
+    write(
+        batch_df.groupBy(*PARTITION_COLUMNS, "Faculty", "Diagnose").agg(count(lit(1)).alias("patient_count")),
+        "report.rollup_faculty_diagnose")
+
+    services = batch_df.select(*PARTITION_COLUMNS, "Room", "Gender", explode("Service").alias("Service"))
+    write(
+        services.groupBy(*PARTITION_COLUMNS, "Room", "Service", "Gender").agg(count(lit(1)).alias("service_count")),
+        "report.rollup_service")
+
+    write(
+        batch_df.groupBy(*PARTITION_COLUMNS, "Diagnose", "age_bucket").agg(
+            count(lit(1)).alias("patient_count"),
+            count("age_at_visit").alias("age_count"),
+            sum_("age_at_visit").alias("age_sum")),
+        "report.rollup_age")
+
+
+def event_time(df):
+    # Bundles only carry the fields their resources use, so keep the candidates the
+    # inferred schema can resolve; rows without any of them fall back to arrival time
+    columns = []
+    for candidate in EVENT_TIME_CANDIDATES:
+        try:
+            df.select(expr(candidate)).schema
+        except AnalysisException:
+            continue
+        columns.append(to_timestamp(expr(candidate)))
+    return coalesce(*columns, col("ArrivalTime"))
+
+
+def recent_files(spark, pattern, limit):
+    # Newest files matching the glob, by modification time, listed through the Hadoop
+    # FileSystem so no file contents are read
+    jvm = spark._jvm
+    path = jvm.org.apache.hadoop.fs.Path(pattern)
+    fs = path.getFileSystem(spark._jsc.hadoopConfiguration())
+    statuses = [status for status in fs.globStatus(path) or [] if status.isFile()]
+    statuses.sort(key=lambda status: status.getModificationTime())
+    return [status.getPath().toString() for status in statuses[-limit:]]
+
+
+def load_schema(spark, location):
+    try:
+        row = spark.read.text(location, wholetext=True).first()
+    except AnalysisException:
+        return None
+    if row is None:
+        return None
+    return StructType.fromJson(json.loads(row.value))
 
-    # Initialize Spark session with Hive support
-    spark = SparkSession.builder \
-        .appName("ETL Report") \
-        .config("hive.metastore.uris", "thrift://hadoop-namenode:9083") \
-        .config("spark.sql.warehouse.dir", "/user/hive/warehouse") \
-        .config("hive.serialization.extend.nesting.levels", "10") \
-        .config("hive.exec.dynamic.partition.mode", "nonstrict") \
-        .enableHiveSupport() \
-        .getOrCreate()
 
-    # Read static data to infer schema
-    static_df = spark.read.json("hdfs://hadoop-namenode:8020/data/*")
+def save_schema(spark, location, schema):
+    spark.createDataFrame([(schema.json(),)], ["value"]) \
+        .coalesce(1) \
+        .write.mode("overwrite") \
+        .text(location)
 
-    # Read streaming data from HDFS
-    streaming_df = spark.readStream \
-        .schema(static_df.schema) \
-        .json("hdfs://hadoop-namenode:8020/data/*")
 
-    # Apply the same transformations on the streaming DataFrame
+# The stream needs a schema up front. Inferring it scans every landed file, so the
+# result is stored and reused on restart; sample_files bounds the scan to the newest
+# files when it does have to run.
+def source_schema(spark, source, location, sample_files=0, refresh=False):
+    schema = None if refresh else load_schema(spark, location)
+    if schema is not None:
+        return schema
+
+    paths = recent_files(spark, source, sample_files) if sample_files else [source]
+    schema = spark.read.json(paths).schema
+    save_schema(spark, location, schema)
+    return schema
+
+
+# Flatten the FHIR bundles into report rows; shared by the stream and the backfill.
+# arrival_time stands in for the visit time of entries that carry none, and is kept
+# as ArrivalTime for deduplication, which drops it again.
+def transform(source_df, arrival_time):
     id_column = col("id")
-    exploded_df = streaming_df.select(id_column, explode("transactions.entry.entry").alias("entry"))
+    exploded_df = source_df.select(id_column, explode("transactions.entry.entry").alias("entry"),
+                                   arrival_time.alias("ArrivalTime"))
     filtered_df = exploded_df.select(
         id_column,
         expr("filter(entry.resource.subscriberId, x -> x is not null)[0]").alias("SubscriberId"),
@@ -47,7 +216,9 @@ if __name__ == "__main__":
         expr("filter(entry.resource.name, x -> x is not null)[2]").alias("HospitalName"),
         expr("filter(entry.resource.reasonCode, x -> x is not null)").alias("Diagnose"),
         expr("filter(entry.resource.requester, x -> x is not null)").alias("Requester"),
-        expr("filter(entry.resource.code, x -> x is not null)").alias("Service")
+        expr("filter(entry.resource.code, x -> x is not null)").alias("Service"),
+        event_time(exploded_df).alias("EventTime"),
+        col("ArrivalTime")
     )
 
     select_df1 = filtered_df.select(
@@ -55,36 +226,262 @@ if __name__ == "__main__":
         expr("SubscriberId"),
         expr("Identifier[0].value[0]").alias("IDPatient"),
         expr("Identifier[1].value[0]").alias("Medical Records"),
-        expr("GET_JSON_OBJECT(Name, '$[0].text')").alias("PatientName"),
+        expr(f"from_json(Name, '{NAME_SCHEMA}')[0].text").alias("PatientName"),
         expr("Gender"),
         expr("BirthDate"),
         expr("Address[0].text").alias("Address"),
-        expr("GET_JSON_OBJECT(Doctor, '$[0].text')").alias("DoctorName"),
-        expr("Faculty"),
-        expr("Room"),
+        expr(f"trim(from_json(Doctor, '{NAME_SCHEMA}')[0].text)").alias("DoctorName"),
+        expr("trim(Faculty)").alias("Faculty"),
+        expr("trim(Room)").alias("Room"),
         expr("HospitalName"),
-        expr("Diagnose[0].text[0]").alias("Diagnose"),
+        expr("trim(Diagnose[0].text[0])").alias("Diagnose"),
         expr("Requester.display[0]").alias("Requester"),
-        expr("transform(Service.coding, x -> x[0].display)").alias("Service")
+        expr("filter(transform(Service.coding, x -> x[0].display), x -> x is not null)").alias("Service"),
+        col("EventTime"),
+        col("ArrivalTime")
     )
 
-    # Add the current year, month, and day as new columns
-    select_df1 = select_df1.withColumn("year", lit(year)) \
-                           .withColumn("month", lit(month)) \
-                           .withColumn("day", lit(day))
-
-    # Define a function to write each micro-batch to Hive
-    def write_to_hive(batch_df, batch_id):
-        batch_df.write.format("hive") \
-            .mode("append") \
-            .partitionBy("year", "month", "day") \
-            .saveAsTable("report.report5")
-
-    # Start the streaming query
-    query = select_df1.writeStream \
-        .outputMode("append") \
-        .foreachBatch(write_to_hive) \
-        .option("checkpointLocation", "/home/hadoop/checkpointLocation/") \
-        .start() \
-        .awaitTermination()
+    # Partition every row by the day of its visit, not by when it was processed
+    return select_df1.withColumn("year", date_format("EventTime", "yyyy")) \
+        .withColumn("month", date_format("EventTime", "MM")) \
+        .withColumn("day", date_format("EventTime", "dd")) \
+        .withColumn("BirthDate", expr(BIRTH_DATE)) \
+        .withColumn("age_at_visit", expr(AGE_AT_VISIT)) \
+        .withColumn("age_bucket", expr(AGE_BUCKET))
+
+
+# Drops re-delivered transactions, keeping state for `delay` of arrival time. The
+# watermark is on ArrivalTime rather than EventTime: arrival only moves forward, so
+# a delayed bundle or a replayed backlog is never dropped as late, and EventTime is
+# left for partitioning alone. Spark 3.5+ deduplicates on the keys alone; earlier
+# versions need a watermarked column in the key to expire state, so re-deliveries
+# are matched within the same arrival window there.
+def deduplicate(df, delay):
+    df = df.withWatermark("ArrivalTime", delay)
+    if hasattr(df, "dropDuplicatesWithinWatermark"):
+        return df.dropDuplicatesWithinWatermark(DEDUP_KEYS).drop("ArrivalTime")
+    return df.withColumn("ArrivalWindow", window("ArrivalTime", delay)) \
+        .dropDuplicates(DEDUP_KEYS + ["ArrivalWindow"]) \
+        .drop("ArrivalWindow", "ArrivalTime")
+
+
+def report_duplicates(query, poll_seconds=60):
+    # Waits on the stream and prints how many duplicates each finished batch dropped,
+    # and how many rows the watermark discarded as too late (expected to stay at 0)
+    last_batch = -1
+    while not query.awaitTermination(poll_seconds):
+        for progress in query.recentProgress:
+            if progress["batchId"] <= last_batch:
+                continue
+            last_batch = progress["batchId"]
+            operators = progress.get("stateOperators", [])
+            dropped = sum(operator.get("customMetrics", {}).get("numDroppedDuplicateRows", 0)
+                          for operator in operators)
+            late = sum(operator.get("numRowsDroppedByWatermark", 0) for operator in operators)
+            print(f"Batch {last_batch}: {progress['numInputRows']} rows in, {dropped} duplicates dropped, "
+                  f"{late} dropped by watermark")
+
+
+# Write each micro-batch to Hive, then fold it into the daily rollups. Visits older
+# than max_lateness_days would change days the API already caches as final, so they
+# are set aside in LATE_TABLE and counted instead; the backfill merges them in later.
+def write_to_hive(batch_df, batch_id, export_dir=None, max_lateness_days=None):
+    batch_df.persist()
+    try:
+        if max_lateness_days:
+            cutoff = (datetime.date.today() - datetime.timedelta(days=max_lateness_days - 1)).isoformat()
+            late = concat_ws("-", *PARTITION_COLUMNS) < cutoff
+            late_rows = batch_df.where(late).count()
+            if late_rows:
+                append_partitioned(batch_df.where(late), LATE_TABLE)
+                print(f"Batch {batch_id}: {late_rows} visits before {cutoff} set aside in {LATE_TABLE}")
+                batch_df = batch_df.where(~late)
+        append_partitioned(batch_df, "report.report5")
+        write_rollups(batch_df)
+        if export_dir:
+            write_rollups(batch_df, write=partial(export_parquet, directory=export_dir))
+    finally:
+        batch_df.unpersist()
+
+
+def clear_api_caches(api_url):
+    # The API keeps past days cached as final; after rewriting them, ask it to drop
+    # its caches. Needs the same REPORT_ADMIN_TOKEN the API runs with.
+    if not api_url:
+        print("Clear the API caches with POST /api/cache/clear")
+        return
+    request = urllib.request.Request(f"{api_url.rstrip('/')}/api/cache/clear", method="POST",
+                                     headers={"X-Admin-Token": os.environ.get("REPORT_ADMIN_TOKEN", "")})
+    try:
+        with urllib.request.urlopen(request, timeout=30):
+            print(f"Cleared the API caches at {api_url}")
+    except OSError as e:
+        print(f"Could not clear the API caches at {api_url}: {e}")
+
+
+def read_progress(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+# Batch backfill over the files that landed between start and end, in chunks of one
+# visit day. Only days inside [overwrite_start, overwrite_end] are rebuilt: report5
+# and the rollups are overwritten with the day's rows from these files, so the range
+# must only hold days whose files all landed in the backfill range and that the
+# stream no longer writes to. Every other day the files touch, e.g. an old day a
+# late visit belongs to, is merged instead: rows report5 already holds are dropped
+# and the rest are appended, with their rollups added on top. Finished chunks are
+# recorded in the progress file so a rerun resumes after them; a merged day that
+# failed between the report5 and rollup writes has to be rebuilt by overwriting.
+def backfill(spark, schema, source, start, end, parallelism, progress_path, export_dir=None,
+             overwrite_start=None, overwrite_end=None, api_url=None):
+    source_df = spark.read.schema(schema) \
+        .option("modifiedAfter", f"{start.isoformat()}T00:00:00") \
+        .option("modifiedBefore", f"{(end + datetime.timedelta(days=1)).isoformat()}T00:00:00") \
+        .json(source)
+    # Replayed files are dated by when they landed, not by when the backfill runs
+    data = transform(source_df, col("_metadata.file_modification_time")) \
+        .dropDuplicates(DEDUP_KEYS) \
+        .drop("ArrivalTime") \
+        .persist()
+    add_missing_columns(spark, "report.report5", data.schema)
+
+    done = read_progress(progress_path)
+    days = sorted(tuple(row) for row in data.select(*PARTITION_COLUMNS).distinct().collect())
+    pending = [day for day in days if "-".join(day) not in done]
+    print(f"Backfill {start} to {end}: {len(days)} visit days, {len(days) - len(pending)} already done")
+
+    def rebuilt(day):
+        visit_day = datetime.date(*map(int, day))
+        return overwrite_start is not None and overwrite_start <= visit_day <= (overwrite_end or end)
+
+    lock = threading.Lock()
+
+    def run(day):
+        where = " AND ".join(f"{column} = '{value}'" for column, value in zip(PARTITION_COLUMNS, day))
+        chunk = data.where(where)
+        if rebuilt(day):
+            overwrite_partitioned(chunk, "report.report5")
+            write_rollups(chunk, write=overwrite_partitioned)
+            if export_dir:
+                write_rollups(chunk, write=partial(export_parquet, directory=export_dir, mode="overwrite"))
+        else:
+            if spark.catalog.tableExists("report.report5"):
+                existing = spark.table("report.report5").where(where).select(*DEDUP_KEYS)
+                # Materialized before the append, so the rollups below are not
+                # recomputed against a report5 that already holds these rows
+                chunk = chunk.join(existing, DEDUP_KEYS, "left_anti").localCheckpoint()
+            append_partitioned(chunk, "report.report5")
+            write_rollups(chunk)
+            if export_dir:
+                write_rollups(chunk, write=partial(export_parquet, directory=export_dir))
+        with lock:
+            with open(progress_path, "a") as f:
+                f.write("-".join(day) + "\n")
+        print(f"Backfilled {'-'.join(day)} ({'rebuilt' if rebuilt(day) else 'merged'})")
+
+    try:
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            # list() re-raises the first failed chunk; the others stay recorded as done
+            list(executor.map(run, pending))
+    finally:
+        data.unpersist()
+    clear_api_caches(api_url)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream FHIR bundles from HDFS into the report tables")
+    parser.add_argument("--source", default=SOURCE_PATH)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_LOCATION)
+    parser.add_argument("--schema-location", default=SCHEMA_LOCATION,
+                        help="where the inferred source schema is stored and reused on restart")
+    parser.add_argument("--schema-sample-files", type=int, default=0,
+                        help="infer the schema from only the N newest files (0 reads them all)")
+    parser.add_argument("--refresh-schema", action="store_true",
+                        help="infer the schema again instead of reusing the stored one")
+    parser.add_argument("--trigger-interval", default="1 minute",
+                        help="processing-time trigger, e.g. '30 seconds'; empty runs batches back to back")
+    parser.add_argument("--max-files-per-trigger", type=int, default=1000)
+    parser.add_argument("--max-bytes-per-trigger", default=None,
+                        help="soft byte cap per micro-batch, e.g. '512m' (only honoured by Spark versions "
+                             "whose file source supports it)")
+    parser.add_argument("--watermark", default="1 day",
+                        help="how long, in arrival time, re-delivered bundles are remembered for deduplication")
+    parser.add_argument("--max-lateness-days", type=int, default=2,
+                        help="visits for days older than this many days (counting today) go to "
+                             f"{LATE_TABLE} instead of the report tables; keep it at the API's LIVE_DAYS, "
+                             "0 accepts any lateness")
+    parser.add_argument("--max-records-per-file", type=int, default=1000000,
+                        help="split output files above this many rows (0 disables)")
+    parser.add_argument("--parquet-export", default=None,
+                        help="also write the rollups as Parquet here, for the API's DuckDB backend; "
+                             "run compact.py with the same --parquet-export to merge closed days")
+    parser.add_argument("--backfill-start", type=datetime.date.fromisoformat, default=None,
+                        help="run a batch backfill over files landed from this date (YYYY-MM-DD) instead of streaming")
+    parser.add_argument("--backfill-end", type=datetime.date.fromisoformat, default=None,
+                        help="last landing date of the backfill, inclusive (default today)")
+    parser.add_argument("--backfill-parallelism", type=int, default=4,
+                        help="visit days written concurrently")
+    parser.add_argument("--backfill-overwrite-start", type=datetime.date.fromisoformat, default=None,
+                        help="first visit day the backfill rebuilds instead of merging into (default none)")
+    parser.add_argument("--backfill-overwrite-end", type=datetime.date.fromisoformat, default=None,
+                        help="last visit day rebuilt, inclusive (default the backfill end)")
+    parser.add_argument("--api-url", default=None,
+                        help="report API to clear the caches of after a backfill, e.g. http://api-host:5000 "
+                             "(sends REPORT_ADMIN_TOKEN from the environment)")
+    parser.add_argument("--backfill-progress", default=None,
+                        help="file recording finished days, used to resume (default backfill-START-END.done)")
+    args = parser.parse_args()
+
+    # Initialize Spark session with Hive support
+    spark = SparkSession.builder \
+        .appName("ETL Report") \
+        .config("hive.metastore.uris", "thrift://hadoop-namenode:9083") \
+        .config("spark.sql.warehouse.dir", "/user/hive/warehouse") \
+        .config("hive.serialization.extend.nesting.levels", "10") \
+        .config("hive.exec.dynamic.partition.mode", "nonstrict") \
+        .config("spark.sql.sources.partitionOverwriteMode", "dynamic") \
+        .config("spark.sql.files.maxRecordsPerFile", str(args.max_records_per_file)) \
+        .enableHiveSupport() \
+        .getOrCreate()
+
+    # Reuse the stored schema, inferring it only on first start or when asked to
+    schema = source_schema(spark, args.source, args.schema_location,
+                           sample_files=args.schema_sample_files, refresh=args.refresh_schema)
+
+    if args.backfill_start:
+        end = args.backfill_end or datetime.date.today()
+        progress = args.backfill_progress or f"backfill-{args.backfill_start}-{end}.done"
+        backfill(spark, schema, args.source, args.backfill_start, end, args.backfill_parallelism, progress,
+                 export_dir=args.parquet_export, overwrite_start=args.backfill_overwrite_start,
+                 overwrite_end=args.backfill_overwrite_end, api_url=args.api_url)
+        spark.stop()
+    else:
+        # Read streaming data from HDFS
+        reader = spark.readStream \
+            .schema(schema) \
+            .option("maxFilesPerTrigger", args.max_files_per_trigger)
+        if args.max_bytes_per_trigger:
+            reader = reader.option("maxBytesPerTrigger", args.max_bytes_per_trigger)
+        streaming_df = reader.json(args.source)
+
+        # Late visits still land in their own day while it is within --max-lateness-days;
+        # the rollups are additive, so appending to it keeps its counts right. Re-delivered
+        # bundles are dropped before they reach either.
+        select_df1 = deduplicate(transform(streaming_df, current_timestamp()), args.watermark)
+        add_missing_columns(spark, "report.report5", select_df1.schema)
+
+        # Start the streaming query
+        # A processing-time trigger groups bursts of small bundles into fewer, larger batches
+        writer = select_df1.writeStream \
+            .outputMode("append") \
+            .foreachBatch(partial(write_to_hive, export_dir=args.parquet_export,
+                                  max_lateness_days=args.max_lateness_days)) \
+            .option("checkpointLocation", args.checkpoint)
+        if args.trigger_interval:
+            writer = writer.trigger(processingTime=args.trigger_interval)
+        query = writer.start()
+        report_duplicates(query)
 
@@ -0,0 +1,291 @@
+from pyspark.sql import SparkSession
+import argparse
+import datetime
+import math
+import re
+import time
+
+from ETL import PARTITION_COLUMNS, clear_api_caches
+
+TABLES = [
+    "report.report5",
+    "report.rollup_patients",
+    "report.rollup_doctor",
+    "report.rollup_faculty_diagnose",
+    "report.rollup_service",
+    "report.rollup_age",
+]
+
+# Storage formats that can be rewritten file by file without a Hive SerDe
+WRITERS = {
+    "org.apache.hadoop.hive.ql.io.orc.OrcInputFormat": "orc",
+    "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat": "parquet",
+}
+
+STAGING_SUFFIX = re.compile(r"\.compact-\d+$")
+
+
+def hadoop_path(spark, location):
+    path = spark._jvm.org.apache.hadoop.fs.Path(location)
+    return path, path.getFileSystem(spark._jsc.hadoopConfiguration())
+
+
+def file_stats(spark, location):
+    path, fs = hadoop_path(spark, location)
+    summary = fs.getContentSummary(path)
+    return summary.getFileCount(), summary.getLength()
+
+
+def data_files(spark, location):
+    # Data files under a location with their sizes, skipping _SUCCESS and hidden files
+    path, fs = hadoop_path(spark, location)
+    files = {}
+    iterator = fs.listFiles(path, True)
+    while iterator.hasNext():
+        status = iterator.next()
+        if not status.getPath().getName().startswith(("_", ".")):
+            files[status.getPath().toString()] = status.getLen()
+    return files
+
+
+def move_files(spark, names, location):
+    target, fs = hadoop_path(spark, location)
+    for name in names:
+        source = spark._jvm.org.apache.hadoop.fs.Path(name)
+        if not fs.rename(source, spark._jvm.org.apache.hadoop.fs.Path(target, source.getName())):
+            raise RuntimeError(f"Could not move {name} to {location}")
+
+
+def partition_spec(values):
+    return ", ".join(f"{column}='{value}'" for column, value in zip(PARTITION_COLUMNS, values))
+
+
+def partition_where(values):
+    return " AND ".join(f"{column} = '{value}'" for column, value in zip(PARTITION_COLUMNS, values))
+
+
+def describe(spark, table, values=None):
+    query = f"DESCRIBE FORMATTED {table}"
+    if values is not None:
+        query += f" PARTITION ({partition_spec(values)})"
+    return {row.col_name.strip().rstrip(":"): (row.data_type or "").strip()
+            for row in spark.sql(query).collect() if row.col_name}
+
+
+def closed_partitions(spark, table, until):
+    # Day partitions strictly before `until`; the ETL may still append to later ones
+    partitions = []
+    for row in spark.sql(f"SHOW PARTITIONS {table}").collect():
+        values = [part.split("=", 1)[1] for part in row[0].split("/")]
+        if datetime.date(*map(int, values)) < until:
+            partitions.append(values)
+    return partitions
+
+
+def compact_partition(spark, table, values, writer, target_bytes, min_files, delete_old):
+    location = describe(spark, table, values)["Location"]
+    files_before, bytes_before = file_stats(spark, location)
+    if files_before < min_files:
+        return None
+    original = data_files(spark, location)
+
+    columns = [column for column in spark.table(table).columns if column not in PARTITION_COLUMNS]
+    data = spark.table(table).where(partition_where(values)).select(*columns)
+    rows = data.count()
+
+    # Write the rewritten partition next to the live one, then verify it before swapping
+    staging = f"{STAGING_SUFFIX.sub('', location)}.compact-{int(time.time())}"
+    data.repartition(max(1, math.ceil(bytes_before / target_bytes))) \
+        .write.mode("overwrite") \
+        .option("compression", "snappy") \
+        .format(writer) \
+        .save(staging)
+
+    staged_rows = spark.read.format(writer).load(staging).count()
+    current_rows = spark.table(table).where(partition_where(values)).count()
+    # The file list must still be the one the rows were read from, or files landing
+    # now would be both staged and moved below
+    if staged_rows != rows or current_rows != rows or data_files(spark, location) != original:
+        # Either the rewrite is incomplete or the partition changed underneath us
+        path, fs = hadoop_path(spark, staging)
+        fs.delete(path, True)
+        raise RuntimeError(f"{table} {partition_spec(values)}: changed during compaction "
+                           f"({rows} read, {staged_rows} staged, {current_rows} now), left untouched")
+
+    spark.sql(f"ALTER TABLE {table} PARTITION ({partition_spec(values)}) SET LOCATION '{staging}'")
+    spark.catalog.refreshTable(table)
+
+    # The stream or a backfill may have written to the old location between the
+    # count and the swap. Files that were replaced mean the partition was rewritten,
+    # so the swap is undone; files that were only added are moved into the new
+    # location, where the table now reads them, before the old one is deleted.
+    current = data_files(spark, location)
+    if any(current.get(name) != size for name, size in original.items()):
+        spark.sql(f"ALTER TABLE {table} PARTITION ({partition_spec(values)}) SET LOCATION '{location}'")
+        spark.catalog.refreshTable(table)
+        path, fs = hadoop_path(spark, staging)
+        fs.delete(path, True)
+        raise RuntimeError(f"{table} {partition_spec(values)}: partition was rewritten during compaction, "
+                           f"swap undone")
+
+    moved = 0
+    for _ in range(3):
+        added = [name for name in data_files(spark, location) if name not in original]
+        if not added:
+            break
+        move_files(spark, added, staging)
+        moved += len(added)
+    else:
+        added = None
+    if moved:
+        spark.catalog.refreshTable(table)
+        print(f"{table} {'/'.join(values)}: moved {moved} files written during the swap")
+
+    if added is None:
+        # Something keeps writing to the old location; leave it for a look by hand
+        print(f"{table} {'/'.join(values)}: files still landing in {location}, kept")
+    elif delete_old:
+        path, fs = hadoop_path(spark, location)
+        fs.delete(path, True)
+
+    files_after, bytes_after = file_stats(spark, staging)
+    return files_before, bytes_before, files_after, bytes_after
+
+
+def compact_table(spark, table, until, target_bytes, min_files, delete_old):
+    writer = WRITERS.get(describe(spark, table).get("InputFormat"))
+    if writer is None:
+        print(f"{table}: skipped, only ORC and Parquet tables can be compacted")
+        return [0, 0, 0, 0]
+
+    totals = [0, 0, 0, 0]
+    for values in closed_partitions(spark, table, until):
+        try:
+            result = compact_partition(spark, table, values, writer, target_bytes, min_files, delete_old)
+        except RuntimeError as e:
+            print(e)
+            continue
+        if result is None:
+            continue
+        files_before, bytes_before, files_after, bytes_after = result
+        print(f"{table} {'/'.join(values)}: {files_before} -> {files_after} files, "
+              f"{bytes_before} -> {bytes_after} bytes")
+        totals = [total + value for total, value in zip(totals, result)]
+    return totals
+
+
+def export_days(spark, directory, table, until):
+    # Closed day directories of a Parquet export, as laid out by ETL.export_parquet
+    path, fs = hadoop_path(spark, f"{directory}/{table}/year=*/month=*/day=*")
+    days = []
+    for status in fs.globStatus(path) or []:
+        location = status.getPath().toString()
+        values = [part.split("=", 1)[1] for part in location.split("/")[-3:]]
+        if status.isDirectory() and datetime.date(*map(int, values)) < until:
+            days.append((values, location))
+    return sorted(days)
+
+
+# The stream appends one export file per table and micro-batch, which DuckDB has to
+# open on every query. A closed day is rewritten into a staging directory outside
+# the export, then swapped in by renaming the day directory out and the staged one
+# in, so readers never see both copies; a query landing between the two renames
+# misses the day, which is why the job clears the API caches when it is done. Files
+# a backfill merged into the old directory meanwhile are moved over after the swap.
+def compact_export_day(spark, directory, table, values, location, target_bytes, min_files):
+    files = data_files(spark, location)
+    if len(files) < min_files:
+        return None
+    bytes_before = sum(files.values())
+    data = spark.read.parquet(*files)
+    rows = data.count()
+
+    relative = f"{table}/{'/'.join(location.split('/')[-3:])}"
+    root = f"{directory.rstrip('/')}.compact-{int(time.time())}"
+    staging, retired = f"{root}/new/{relative}", f"{root}/old/{relative}"
+    data.repartition(max(1, math.ceil(bytes_before / target_bytes))) \
+        .write.mode("overwrite") \
+        .option("compression", "snappy") \
+        .parquet(staging)
+    staged = data_files(spark, staging)
+    root_path, fs = hadoop_path(spark, root)
+    if spark.read.parquet(*staged).count() != rows:
+        fs.delete(root_path, True)
+        raise RuntimeError(f"{table} {'/'.join(values)} export: rewrite incomplete, left untouched")
+
+    location_path, _ = hadoop_path(spark, location)
+    retired_path, _ = hadoop_path(spark, retired)
+    fs.mkdirs(retired_path.getParent())
+    if not fs.rename(location_path, retired_path):
+        fs.delete(root_path, True)
+        raise RuntimeError(f"{table} {'/'.join(values)} export: could not move {location} aside, left untouched")
+    if not fs.rename(hadoop_path(spark, staging)[0], location_path):
+        fs.rename(retired_path, location_path)
+        raise RuntimeError(f"{table} {'/'.join(values)} export: could not swap in {staging}, "
+                           f"restored the original")
+
+    read = {name.rsplit("/", 1)[-1] for name in files}
+    late = [name for name in data_files(spark, retired) if name.rsplit("/", 1)[-1] not in read]
+    move_files(spark, late, location)
+    fs.delete(root_path, True)
+    return len(files), bytes_before, len(staged), sum(staged.values())
+
+
+def compact_export(spark, directory, table, until, target_bytes, min_files):
+    totals = [0, 0, 0, 0]
+    for values, location in export_days(spark, directory, table, until):
+        try:
+            result = compact_export_day(spark, directory, table, values, location, target_bytes, min_files)
+        except RuntimeError as e:
+            print(e)
+            continue
+        if result is None:
+            continue
+        files_before, bytes_before, files_after, bytes_after = result
+        print(f"{table} {'/'.join(values)} export: {files_before} -> {files_after} files, "
+              f"{bytes_before} -> {bytes_after} bytes")
+        totals = [total + value for total, value in zip(totals, result)]
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rewrite closed report partitions into fewer, larger files")
+    parser.add_argument("--tables", nargs="+", default=TABLES)
+    parser.add_argument("--min-age-days", type=int, default=2,
+                        help="only compact day partitions at least this many days old")
+    parser.add_argument("--target-file-size-mb", type=int, default=128)
+    parser.add_argument("--min-files", type=int, default=2,
+                        help="leave partitions with fewer files than this alone")
+    parser.add_argument("--keep-old", action="store_true",
+                        help="keep the previous partition directory after the swap")
+    parser.add_argument("--parquet-export", default=None,
+                        help="also compact the closed days of the ETL's Parquet export of the rollups here")
+    parser.add_argument("--api-url", default=None,
+                        help="report API to clear the caches of after compacting the export "
+                             "(sends REPORT_ADMIN_TOKEN)")
+    args = parser.parse_args()
+
+    until = datetime.date.today() - datetime.timedelta(days=args.min_age_days - 1)
+
+    spark = SparkSession.builder \
+        .appName("Compact Report") \
+        .config("hive.metastore.uris", "thrift://hadoop-namenode:9083") \
+        .config("spark.sql.warehouse.dir", "/user/hive/warehouse") \
+        .enableHiveSupport() \
+        .getOrCreate()
+
+    export_compacted = False
+    for table in args.tables:
+        files_before, bytes_before, files_after, bytes_after = compact_table(
+            spark, table, until, args.target_file_size_mb * 1024 * 1024, args.min_files, not args.keep_old)
+        print(f"{table} total: {files_before} -> {files_after} files, {bytes_before} -> {bytes_after} bytes")
+        if args.parquet_export:
+            files_before, bytes_before, files_after, bytes_after = compact_export(
+                spark, args.parquet_export, table, until, args.target_file_size_mb * 1024 * 1024, args.min_files)
+            print(f"{table} export total: {files_before} -> {files_after} files, "
+                  f"{bytes_before} -> {bytes_after} bytes")
+            export_compacted = export_compacted or files_before > 0
+
+    if export_compacted:
+        clear_api_caches(args.api_url)
+    spark.stop()
@@ -0,0 +1,100 @@
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import col, concat_ws, expr, from_json, lpad
+from pyspark.sql.types import ArrayType, StringType
+from functools import partial
+import argparse
+import datetime
+
+from ETL import AGE_AT_VISIT, AGE_BUCKET, BIRTH_DATE, PARTITION_COLUMNS, clear_api_caches, export_parquet, \
+    overwrite_partitioned, write_rollups
+
+SOURCE_TABLE = "report.report"
+
+
+def covered_days(spark, table):
+    # Day partitions the stream (or an earlier seed) has already written
+    if not spark.catalog.tableExists(table):
+        return set()
+    days = set()
+    for row in spark.sql(f"SHOW PARTITIONS {table}").collect():
+        days.add(tuple(part.split("=", 1)[1] for part in row[0].split("/")))
+    return days
+
+
+# The legacy report rows in the shape write_rollups expects: zero-padded string
+# partitions, trimmed names, Service as an array and the age columns the ETL adds
+def normalize(df):
+    service = col("Service")
+    if not isinstance(df.schema["Service"].dataType, ArrayType):
+        # Stored as the serialized JSON array the API used to parse per request
+        service = from_json(col("Service"), ArrayType(StringType()))
+    return df.select(
+        lpad(col("year").cast("string"), 4, "0").alias("year"),
+        lpad(col("month").cast("string"), 2, "0").alias("month"),
+        lpad(col("day").cast("string"), 2, "0").alias("day"),
+        expr("trim(DoctorName)").alias("DoctorName"),
+        expr("trim(Faculty)").alias("Faculty"),
+        expr("trim(Room)").alias("Room"),
+        expr("trim(Diagnose)").alias("Diagnose"),
+        col("Gender"),
+        service.alias("Service"),
+        col("BirthDate"),
+    ).withColumn("BirthDate", expr(BIRTH_DATE)) \
+        .withColumn("age_at_visit", expr(AGE_AT_VISIT)) \
+        .withColumn("age_bucket", expr(AGE_BUCKET))
+
+
+# Fills the rollups for the days of the legacy table they do not cover yet. Each day
+# is written with partition overwrite, so a failed seed can simply be rerun.
+def seed(spark, source, start=None, end=None, overwrite=False, export_dir=None, api_url=None):
+    data = normalize(spark.table(source))
+    visit_day = concat_ws("-", *PARTITION_COLUMNS)
+    if start:
+        data = data.where(visit_day >= start.isoformat())
+    if end:
+        data = data.where(visit_day <= end.isoformat())
+
+    days = {tuple(row) for row in data.select(*PARTITION_COLUMNS).distinct().collect()}
+    skipped = set() if overwrite else days & covered_days(spark, "report.rollup_patients")
+    pending = sorted(days - skipped)
+    print(f"Seeding {len(pending)} days from {source}, {len(skipped)} already in the rollups")
+    if not pending:
+        return
+
+    data = data.where(visit_day.isin(["-".join(day) for day in pending])).persist()
+    try:
+        write_rollups(data, write=overwrite_partitioned)
+        if export_dir:
+            write_rollups(data, write=partial(export_parquet, directory=export_dir, mode="overwrite"))
+    finally:
+        data.unpersist()
+    print(f"Seeded {'-'.join(pending[0])} to {'-'.join(pending[-1])}")
+    clear_api_caches(api_url)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the daily rollup tables from the legacy report table")
+    parser.add_argument("--source", default=SOURCE_TABLE)
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=None,
+                        help="first visit day to seed (YYYY-MM-DD, default the oldest)")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=None,
+                        help="last visit day to seed, inclusive (default the newest)")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="also rewrite days the rollups already hold")
+    parser.add_argument("--parquet-export", default=None,
+                        help="also write the seeded rollups as Parquet here, for the API's DuckDB backend")
+    parser.add_argument("--api-url", default=None,
+                        help="report API to clear the caches of afterwards (sends REPORT_ADMIN_TOKEN)")
+    args = parser.parse_args()
+
+    spark = SparkSession.builder \
+        .appName("Seed Report Rollups") \
+        .config("hive.metastore.uris", "thrift://hadoop-namenode:9083") \
+        .config("spark.sql.warehouse.dir", "/user/hive/warehouse") \
+        .config("hive.exec.dynamic.partition.mode", "nonstrict") \
+        .config("spark.sql.sources.partitionOverwriteMode", "dynamic") \
+        .enableHiveSupport() \
+        .getOrCreate()
+
+    seed(spark, args.source, args.start, args.end, args.overwrite, args.parquet_export, args.api_url)
+    spark.stop()